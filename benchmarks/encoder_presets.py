@@ -0,0 +1,103 @@
+"""Encode a generated test clip with every quality preset in options.json and report speed and size.
+
+The clip comes from ffmpeg's lavfi testsrc and sine sources, so runs are
+reproducible on any machine. Use --sweep to also try other libx264 speed
+presets for the video options before settling on one in options.json.
+
+	python benchmarks/encoder_presets.py --duration 20 --size 1920x1080
+	python benchmarks/encoder_presets.py --format mp4 --sweep ultrafast,veryfast,medium --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ffmpeg_process import FfmpegProcess
+from presets import preset_ffmpeg_args
+
+
+
+def generate_clip(path, duration, size, rate):
+	ffmpeg_command = [
+		'ffmpeg',
+		'-f', 'lavfi', '-i', f'testsrc=duration={duration}:size={size}:rate={rate}',
+		'-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+		'-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0',
+		'-c:a', 'pcm_s16le',
+		'-y', path
+	]
+	if FfmpegProcess(ffmpeg_command).run() != 0:
+		raise RuntimeError("Could not generate the test clip")
+
+
+def benchmark_preset(source, quality_option, output_media):
+	last_progress = {}
+	ffmpeg_command = ['ffmpeg', '-i', source, *preset_ffmpeg_args(quality_option).split(), '-y', output_media]
+	process = FfmpegProcess(ffmpeg_command, last_progress.update, progress_interval=0)
+
+	start_time = time.perf_counter()
+	returncode = process.run()
+	wall_time = time.perf_counter() - start_time
+
+	return {
+		'name': quality_option['name'],
+		'ffmpeg_args': preset_ffmpeg_args(quality_option),
+		'returncode': returncode,
+		'wall_time': round(wall_time, 3),
+		'encode_fps': round(last_progress.get('frame', 0) / wall_time, 1),
+		'speed': round(last_progress.get('speed', 0.0), 2),
+		'output_size': os.path.getsize(output_media) if returncode == 0 else None,
+	}
+
+
+def benchmark_variants(quality_options, selected_format, sweep):
+	for quality_option in quality_options.get(selected_format, []):
+		yield quality_option
+		for speed_preset in sweep:
+			encoder = dict(quality_option.get('encoder', {}), preset=speed_preset)
+			yield dict(quality_option, name=f"{quality_option['name']} [{speed_preset}]", encoder=encoder)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--options', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'options.json'))
+	parser.add_argument('--format', action='append', help='only benchmark these formats (default: all)')
+	parser.add_argument('--duration', type=int, default=10, help='test clip length in seconds')
+	parser.add_argument('--size', default='1920x1080', help='test clip resolution')
+	parser.add_argument('--rate', type=int, default=30, help='test clip frame rate')
+	parser.add_argument('--sweep', default='', help='comma separated libx264 speed presets to try for video options')
+	parser.add_argument('--json', help='also write the results to this file')
+	args = parser.parse_args()
+
+	with open(args.options, 'r') as file:
+		options = json.load(file)
+	format_to_extension = options["format_to_extension"]
+	sweep = [speed_preset for speed_preset in args.sweep.split(',') if speed_preset]
+
+	results = []
+	with tempfile.TemporaryDirectory() as work_directory:
+		source = os.path.join(work_directory, 'source.mkv')
+		generate_clip(source, args.duration, args.size, args.rate)
+
+		for selected_format in args.format or options["format_options"]:
+			output_extension = format_to_extension.get(selected_format, 'mp4')
+			formats_sweep = sweep if selected_format != 'mp3' else []
+			for index, quality_option in enumerate(benchmark_variants(options["quality_options"], selected_format, formats_sweep)):
+				output_media = os.path.join(work_directory, f'{index}.{output_extension}')
+				result = dict(benchmark_preset(source, quality_option, output_media), format=selected_format)
+				results.append(result)
+
+				size = f"{result['output_size'] / 1024:.0f} KiB" if result['output_size'] is not None else "failed"
+				print(f"{selected_format:4} {result['name']:32} {result['wall_time']:8.2f} s {result['encode_fps']:8.1f} fps {result['speed']:6.2f}x {size:>12}")
+
+	if args.json:
+		with open(args.json, 'w') as file:
+			json.dump({'clip': {'duration': args.duration, 'size': args.size, 'rate': args.rate}, 'results': results}, file, indent=4)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,93 @@
+"""Compare the old extract_info + download flow with a single extract_info(download=True) pass.
+
+A stub extractor sleeps for a fixed latency on every resolve and serves a small
+local file through a file:// URL, so the difference between both flows is the
+number of extractor round-trips and nothing else.
+
+	python benchmarks/extract_info_roundtrip.py --latency 0.5 --runs 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import yt_dlp as youtube_dl
+from yt_dlp.extractor.common import InfoExtractor
+
+
+
+class StubIE(InfoExtractor):
+	_VALID_URL = r'stub://(?P<id>[^/?#]+)'
+	latency = 0.0
+	media_path = None
+	resolve_count = 0
+
+	def _real_extract(self, url):
+		video_id = self._match_id(url)
+		StubIE.resolve_count += 1
+		time.sleep(self.latency)
+		return {
+			'id': video_id,
+			'title': f'Stub {video_id}',
+			'url': 'file://' + self.media_path,
+			'ext': 'mp4',
+		}
+
+
+def make_ydl(destination):
+	ydl_opts = {
+		'quiet': True,
+		'noprogress': True,
+		'no_warnings': True,
+		'enable_file_urls': True,
+		'outtmpl': os.path.join(destination, '%(title)s.%(ext)s'),
+		'overwrites': True,
+	}
+	ydl = youtube_dl.YoutubeDL(ydl_opts, auto_init=False)
+	ydl.add_info_extractor(StubIE())
+	return ydl
+
+
+def two_pass(url, destination):
+	with make_ydl(destination) as ydl:
+		ydl.extract_info(url, download=False)
+		ydl.download([url])
+
+
+def single_pass(url, destination):
+	with make_ydl(destination) as ydl:
+		info_dict = ydl.extract_info(url, download=True)
+		return info_dict['requested_downloads'][0]['filepath']
+
+
+def measure(flow, runs, destination):
+	StubIE.resolve_count = 0
+	start_time = time.perf_counter()
+	for run in range(runs):
+		flow(f'stub://video{run}', destination)
+	return (time.perf_counter() - start_time) / runs, StubIE.resolve_count / runs
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--latency', type=float, default=0.5, help='seconds every stub resolve takes')
+	parser.add_argument('--runs', type=int, default=5)
+	parser.add_argument('--size', type=int, default=1024 * 1024, help='size of the served file in bytes')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as destination:
+		StubIE.latency = args.latency
+		StubIE.media_path = os.path.join(destination, 'source.mp4')
+		with open(StubIE.media_path, 'wb') as file:
+			file.write(os.urandom(args.size))
+
+		two_pass_time, two_pass_resolves = measure(two_pass, args.runs, destination)
+		single_pass_time, single_pass_resolves = measure(single_pass, args.runs, destination)
+
+	print(f"extract_info + download:       {two_pass_time:.3f} s/item, {two_pass_resolves:.0f} resolves/item")
+	print(f"extract_info(download=True):   {single_pass_time:.3f} s/item, {single_pass_resolves:.0f} resolves/item")
+	print(f"speedup: {two_pass_time / single_pass_time:.2f}x")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,282 @@
+"""Time downloads, conversions and the whole download and convert pipeline on generated media served from localhost.
+
+The clip comes from ffmpeg's lavfi testsrc and sine sources and is served by a
+local HTTP stand-in. yt-dlp's generic extractor resolves every URL as a direct
+media link, so the real Downloader, BatchConverter and download job code runs
+without touching the network. Every stage is timed at each batch size and
+concurrency level, and --json keeps the results to compare runs across commits.
+
+	python benchmarks/pipeline.py --batch-sizes 1,4,8 --concurrency 1,2,4 --json before.json
+	python benchmarks/pipeline.py --stages convert --format mp4 --quality "SD 480P" --duration 30
+	python benchmarks/pipeline.py --latency 0.2 --bandwidth 2M --json slow-server.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import BatchConverter, conversion_output_path
+from downloader import Downloader, build_ydl_opts, parse_rate_limit
+from ffmpeg_process import FfmpegProcess, ffmpeg_version
+from jobs import download_job, job_quality_option
+from presets import download_format, preset_ffmpeg_args
+
+
+
+STAGES = ('download', 'convert', 'pipeline')
+
+
+def ignore(message):
+	pass
+
+
+def generate_clip(path, duration, size, rate):
+	# A real h264 and aac file, like the ones the downloads usually bring in
+	ffmpeg_command = [
+		'ffmpeg',
+		'-f', 'lavfi', '-i', f'testsrc=duration={duration}:size={size}:rate={rate}',
+		'-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+		'-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+		'-c:a', 'aac', '-shortest',
+		'-y', path
+	]
+	if FfmpegProcess(ffmpeg_command).run() != 0:
+		raise RuntimeError("Could not generate the test clip")
+
+
+
+class MediaRequestHandler(SimpleHTTPRequestHandler):
+	media_path = None
+	latency = 0.0
+	bandwidth = None
+
+	def translate_path(self, path):
+		# Every /media/<name>.mp4 is the same clip, distinct names give distinct titles and output files
+		return self.media_path
+
+
+	def send_head(self):
+		time.sleep(self.latency)
+		return super().send_head()
+
+
+	def copyfile(self, source, outputfile):
+		# The generic extractor reads the start of a response to sniff it and hangs up
+		try:
+			self.send_body(source, outputfile)
+		except (BrokenPipeError, ConnectionResetError):
+			pass
+
+
+	def send_body(self, source, outputfile):
+		if not self.bandwidth:
+			return shutil.copyfileobj(source, outputfile)
+
+		start_time = time.monotonic()
+		sent_bytes = 0
+		while True:
+			chunk = source.read(64 * 1024)
+			if not chunk:
+				break
+			outputfile.write(chunk)
+			sent_bytes += len(chunk)
+			delay = sent_bytes / self.bandwidth - (time.monotonic() - start_time)
+			if delay > 0:
+				time.sleep(delay)
+
+
+	def log_message(self, format, *args):
+		pass
+
+
+""" The class end here """
+
+
+
+class DownloadOnly(Downloader):
+	# The download stage stops where the conversion would start, the pipeline stage times both
+	def convert_video(self, input_media, selected_quality_option):
+		return input_media
+
+
+""" The class end here """
+
+
+def start_server(media_path, latency, bandwidth):
+	handler = type('BenchmarkRequestHandler', (MediaRequestHandler,), {'media_path': media_path, 'latency': latency, 'bandwidth': bandwidth})
+	server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+def benchmark_download(options, quality_option, urls, concurrency, destination):
+	performance_options = options["performance_options"]
+	selected_download_format = download_format(options.get("format_to_download_format", {}), quality_option)
+
+	def run_download(url):
+		ydl_opts = dict(build_ydl_opts(destination, selected_download_format, False, performance_options), quiet=True, noprogress=True)
+		DownloadOnly(url, ydl_opts, quality_option, destination, options["format_to_extension"], False, performance_options, log=ignore).run()
+
+	failed = 0
+	with ThreadPoolExecutor(max_workers=concurrency) as executor:
+		for future in [executor.submit(run_download, url) for url in urls]:
+			try:
+				future.result()
+			except Exception:
+				failed += 1
+	return failed
+
+
+def benchmark_convert(options, quality_option, input_media_files, concurrency, destination):
+	output_extension = options["format_to_extension"].get(quality_option["format"], 'mp4')
+	output_media_files = [conversion_output_path(destination, media, quality_option["name"], output_extension) for media in input_media_files]
+	# No conversion cache, every run has to encode
+	batch_converter = BatchConverter(input_media_files, preset_ffmpeg_args(quality_option), output_media_files, concurrency, log=ignore)
+	return len(input_media_files) - batch_converter.run()
+
+
+def benchmark_pipeline(options, quality_option, urls, concurrency, destination):
+	spec = {
+		'type': 'download',
+		'urls': urls,
+		'format': quality_option["format"],
+		'quality': quality_option["name"],
+		'destination': destination,
+		'workers': concurrency,
+	}
+	download_job(options, spec, log=ignore)
+	output_extension = options["format_to_extension"].get(quality_option["format"], 'mp4')
+	return len(urls) - sum(1 for name in os.listdir(destination) if name.endswith(f'.{output_extension}'))
+
+
+def run_case(stage, options, quality_option, case_name, urls, source, concurrency, work_directory):
+	destination = os.path.join(work_directory, case_name)
+	os.makedirs(destination)
+	if stage == 'convert':
+		input_directory = os.path.join(work_directory, f'{case_name}-inputs')
+		os.makedirs(input_directory)
+		input_media_files = [os.path.join(input_directory, f'item{index}.mp4') for index in range(len(urls))]
+		for input_media in input_media_files:
+			os.link(source, input_media)
+
+	start_time = time.perf_counter()
+	if stage == 'download':
+		failed = benchmark_download(options, quality_option, urls, concurrency, destination)
+	elif stage == 'convert':
+		failed = benchmark_convert(options, quality_option, input_media_files, concurrency, destination)
+	else:
+		failed = benchmark_pipeline(options, quality_option, urls, concurrency, destination)
+	seconds = time.perf_counter() - start_time
+
+	shutil.rmtree(destination, ignore_errors=True)
+	if stage == 'convert':
+		shutil.rmtree(input_directory, ignore_errors=True)
+	return seconds, failed
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--options', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'options.json'))
+	parser.add_argument('--stages', default=','.join(STAGES), help=f'comma separated stages to time (default: {",".join(STAGES)})')
+	parser.add_argument('--batch-sizes', default='1,4', help='comma separated numbers of items per batch')
+	parser.add_argument('--concurrency', default='1,2,4', help='comma separated numbers of parallel downloads or conversions')
+	parser.add_argument('--runs', type=int, default=1, help='runs of every case')
+	parser.add_argument('--format', default='mp3', help='output format of the convert and pipeline stages')
+	parser.add_argument('--quality', default='128Kbps', help='quality option name within the format')
+	parser.add_argument('--duration', type=int, default=10, help='test clip length in seconds')
+	parser.add_argument('--size', default='1280x720', help='test clip resolution')
+	parser.add_argument('--rate', type=int, default=30, help='test clip frame rate')
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds the local server waits before every response')
+	parser.add_argument('--bandwidth', help='bytes per second the local server sends per connection, e.g. 2M (default: unlimited)')
+	parser.add_argument('--json', help='also write the results to this file')
+	args = parser.parse_args()
+
+	with open(args.options, 'r') as file:
+		options = json.load(file)
+	# Every item comes from the same local host, it must not be the per-host limit that is measured
+	options["performance_options"] = dict(
+		options.get("performance_options", {}), auto_tune_fragments=False, retry_attempts=1, metrics_log='',
+		loudness_normalization=False, max_downloads_per_host=0)
+	quality_option = job_quality_option(options, {'format': args.format, 'quality': args.quality})
+	stages = [stage for stage in args.stages.split(',') if stage]
+	unknown_stages = [stage for stage in stages if stage not in STAGES]
+	if unknown_stages:
+		parser.error(f"unknown stages {', '.join(unknown_stages)}, use {', '.join(STAGES)}")
+	batch_sizes = [int(batch_size) for batch_size in args.batch_sizes.split(',') if batch_size]
+	concurrency_levels = [int(concurrency) for concurrency in args.concurrency.split(',') if concurrency]
+	json_path = os.path.abspath(args.json) if args.json else None
+
+	import yt_dlp
+	machine = {
+		'platform': platform.platform(),
+		'cpu_count': os.cpu_count(),
+		'python': platform.python_version(),
+		'ffmpeg': ffmpeg_version(),
+		'yt_dlp': yt_dlp.version.__version__,
+	}
+
+	results = []
+	previous_directory = os.getcwd()
+	with tempfile.TemporaryDirectory() as work_directory:
+		# The metadata cache and download archive are opened in the working directory, they must not be the repo's
+		os.chdir(work_directory)
+		try:
+			source = os.path.join(work_directory, 'source.mp4')
+			generate_clip(source, args.duration, args.size, args.rate)
+			source_size = os.path.getsize(source)
+			server = start_server(source, args.latency, parse_rate_limit(args.bandwidth))
+
+			case_index = 0
+			for stage in stages:
+				for batch_size in batch_sizes:
+					for concurrency in concurrency_levels:
+						for run in range(1, args.runs + 1):
+							case_index += 1
+							case_name = f'case{case_index}'
+							# Fresh URLs for every case, so nothing is answered from the metadata cache of an earlier one
+							urls = [f'http://127.0.0.1:{server.server_address[1]}/media/{case_name}-item{index}.mp4' for index in range(batch_size)]
+							seconds, failed = run_case(stage, options, quality_option, case_name, urls, source, concurrency, work_directory)
+
+							completed = batch_size - failed
+							result = {
+								'stage': stage,
+								'batch_size': batch_size,
+								'concurrency': concurrency,
+								'run': run,
+								'seconds': round(seconds, 3),
+								'failed': failed,
+								'items_per_minute': round(completed / seconds * 60, 2),
+								'megabytes_per_second': round(completed * source_size / seconds / (1024 * 1024), 2),
+								'realtime_factor': round(completed * args.duration / seconds, 2),
+							}
+							results.append(result)
+							print(
+								f"{stage:8} batch {batch_size:3} x{concurrency:<3} run {run}: {seconds:8.2f} s {result['items_per_minute']:9.1f} items/min "
+								f"{result['megabytes_per_second']:8.2f} MB/s {result['realtime_factor']:8.1f}x realtime{f', {failed} failed' if failed else ''}")
+			server.shutdown()
+		finally:
+			os.chdir(previous_directory)
+
+	if json_path:
+		with open(json_path, 'w') as file:
+			json.dump({
+				'machine': machine,
+				'clip': {'duration': args.duration, 'size': args.size, 'rate': args.rate, 'bytes': source_size},
+				'preset': {'format': quality_option["format"], 'quality': quality_option["name"], 'ffmpeg_args': preset_ffmpeg_args(quality_option)},
+				'server': {'latency': args.latency, 'bandwidth': args.bandwidth},
+				'results': results,
+			}, file, indent=4)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,58 @@
+import threading
+
+
+
+class JobCancelled(Exception):
+	pass
+
+
+
+class CancellationToken:
+	def __init__(self):
+		self.event = threading.Event()
+		self.callbacks = []
+		self.lock = threading.Lock()
+
+
+	@property
+	def cancelled(self):
+		return self.event.is_set()
+
+
+	def cancel(self):
+		with self.lock:
+			if self.event.is_set():
+				return
+			self.event.set()
+			callbacks = list(self.callbacks)
+		for callback in callbacks:
+			callback()
+
+
+	def wait(self, timeout):
+		# Sleeps like time.sleep, but returns True as soon as the token is cancelled
+		return self.event.wait(timeout)
+
+
+	def raise_if_cancelled(self):
+		if self.event.is_set():
+			raise JobCancelled("Cancelled")
+
+
+	def register(self, callback):
+		# Returns a function that removes the callback again, already cancelled tokens call it right away
+		with self.lock:
+			if not self.event.is_set():
+				self.callbacks.append(callback)
+				return lambda: self.unregister(callback)
+		callback()
+		return lambda: None
+
+
+	def unregister(self, callback):
+		with self.lock:
+			if callback in self.callbacks:
+				self.callbacks.remove(callback)
+
+
+""" The class end here """
@@ -0,0 +1,208 @@
+"""Headless batch entry point sharing the download and conversion engines with the GUI.
+
+	python -m cli convert --format mp3 --quality 192Kbps "recordings/*.wav"
+	python -m cli convert --preset mp3/320Kbps --preset mp3/128Kbps --preset "mp4/HD 720P" talk.mkv
+	python -m cli convert --format mp3 --quality 128Kbps --normalize-loudness "mixtape/*.flac"
+	python -m cli download --format mp4 --quality "HD 720P" --url-file urls.txt
+	python -m cli watch --format mp3 --quality 192Kbps --destination converted intake
+	python -m cli download --fragments 8 --rate-limit 4M https://example.com/stream.m3u8
+	python -m cli serve --port 8770
+	python -m cli cache
+	python -m cli convert --server http://127.0.0.1:8770 --format mp3 "recordings/*.wav"
+"""
+import argparse
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import CancellationToken
+from jobs import run_job, validate_job
+from metrics import configure_metrics
+from presets import load_options
+
+
+
+def read_urls(args):
+	urls = list(args.urls)
+	if args.url_file:
+		with open(args.url_file, 'r', encoding='utf-8') as file:
+			urls += [line.strip() for line in file if line.strip() and not line.strip().startswith('#')]
+	return urls
+
+
+def job_spec(args):
+	spec = {
+		'type': args.command,
+		'format': args.format,
+		'quality': args.quality,
+		'destination': args.destination,
+		'workers': args.workers,
+		'normalize_loudness': args.normalize_loudness,
+	}
+	if args.command == 'convert':
+		spec.update(media=args.media, presets=args.presets, segments=args.segments, cache=not args.no_cache)
+	elif args.command == 'watch':
+		spec.update(folder=args.folder, presets=args.presets, segments=args.segments, cache=not args.no_cache)
+	else:
+		spec.update(urls=read_urls(args), playlist=args.playlist, sync=args.sync, refresh_metadata=args.refresh_metadata)
+		acceleration = {
+			'concurrent_fragments': args.fragments,
+			'auto_tune_fragments': args.auto_tune,
+			'http_chunk_size_mb': args.chunk_size,
+			'download_rate_limit': args.rate_limit,
+			'download_buffer_kb': args.buffer_size,
+		}
+		spec['acceleration'] = {key: value for key, value in acceleration.items() if value is not None}
+	return spec
+
+
+def submit_command(spec, args):
+	from job_client import JobClient, JobServerError
+
+	# The server resolves paths against its own working directory
+	spec['destination'] = os.path.abspath(spec['destination'])
+	if spec['type'] == 'convert':
+		spec['media'] = [os.path.abspath(media) for media in spec['media']]
+	if spec['type'] == 'watch':
+		spec['folder'] = os.path.abspath(spec['folder'])
+
+	client = JobClient(args.server)
+	job = None
+	try:
+		job = client.submit(spec, args.priority)
+		print(f"Submitted job {job['id']} to {args.server}", flush=True)
+		for event in client.events(job['id']):
+			if 'message' in event:
+				print(event['message'], flush=True)
+			else:
+				print(f"Job {job['id']} {event['status']}", flush=True)
+				return 0 if event['status'] == 'finished' else 1
+	except KeyboardInterrupt:
+		if job is not None:
+			client.cancel(job['id'])
+		return 1
+	except (JobServerError, OSError) as e:
+		raise SystemExit(f"Job server error: {str(e)}")
+	return 1
+
+
+def run_local_job(options, spec):
+	# The job runs on a worker thread so Ctrl+C reaches this one and can cancel it cleanly
+	cancel_token = CancellationToken()
+	with ThreadPoolExecutor(max_workers=1) as executor:
+		future = executor.submit(run_job, options, spec, lambda message: print(message, flush=True), cancel_token)
+		try:
+			return future.result()
+		except KeyboardInterrupt:
+			print("Cancelling, waiting for the running steps to stop...", flush=True)
+			cancel_token.cancel()
+			try:
+				future.result()
+			except Exception:
+				pass
+			return 130
+
+
+def cache_command(options, args):
+	from conversion_cache import open_conversion_cache
+	from loudness_cache import open_loudness_cache
+
+	conversion_cache = open_conversion_cache(dict(options.get("performance_options", {}), conversion_cache=True))
+	loudness_cache = open_loudness_cache(options.get("performance_options", {}))
+	if args.clear:
+		conversion_cache.clear()
+		loudness_cache.clear()
+		print("Conversion and loudness caches cleared")
+		return 0
+
+	stats = conversion_cache.stats()
+	print(f"Cached outputs: {stats['entries']} ({stats['size'] / (1024 * 1024):.1f} MB)")
+	print(f"Hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {stats['hit_rate']:.0%}")
+	print(f"Reused: {stats['reused_bytes'] / (1024 * 1024):.1f} MB, stored: {stats['stored']}, evicted: {stats['evicted']}")
+	print(f"Loudness measurements: {loudness_cache.count()}")
+	return 0
+
+
+def serve_command(options, args):
+	# Imported here so batch jobs do not pay for the server modules
+	from job_server import serve
+
+	performance_options = options.get("performance_options", {})
+	serve(options, args.host, args.port, args.workers or performance_options.get("server_max_jobs") or 2)
+	return 0
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m cli', description=__doc__.splitlines()[0])
+	parser.add_argument('--options', help='options.json to use (default: the one next to the application)')
+	parser.add_argument('--metrics-log', help='append structured job events to this JSON-lines file (default: metrics_log in options.json)')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	convert_parser = subparsers.add_parser('convert', help='convert local media files')
+	convert_parser.add_argument('media', nargs='+', help='media files or glob patterns')
+	convert_parser.add_argument('--destination', default=os.path.join(os.getcwd(), "converted"))
+
+	watch_parser = subparsers.add_parser('watch', help='convert every new file dropped into a folder until stopped')
+	watch_parser.add_argument('folder', help='hot folder to watch')
+	watch_parser.add_argument('--destination', default=os.path.join(os.getcwd(), "converted"))
+
+	for subparser in (convert_parser, watch_parser):
+		subparser.add_argument('--preset', dest='presets', action='append',
+			help='"format/quality" to convert to, repeat it to write several presets from one decode')
+		subparser.add_argument('--segments', type=int,
+			help='encode long videos as this many keyframe aligned segments in parallel (0 turns it off)')
+		subparser.add_argument('--no-cache', action='store_true', help='convert again even if the conversion cache has the output')
+
+	download_parser = subparsers.add_parser('download', help='download and convert URLs')
+	download_parser.add_argument('urls', nargs='*')
+	download_parser.add_argument('--url-file', help='text file with one URL per line')
+	download_parser.add_argument('--destination', default=os.path.join(os.getcwd(), "download"))
+	download_parser.add_argument('--playlist', action='store_true', help='download and convert every playlist entry')
+	download_parser.add_argument('--sync', action='store_true', help='skip playlist entries already in the download archive')
+	download_parser.add_argument('--refresh-metadata', action='store_true', help='ignore cached URL metadata')
+	download_parser.add_argument('--fragments', type=int, help='HLS and DASH fragments downloaded at the same time')
+	download_parser.add_argument('--auto-tune', action=argparse.BooleanOptionalAction,
+		help='measure each download and adjust the fragments for the next one from the same site')
+	download_parser.add_argument('--chunk-size', type=int, help='download in ranged requests of this many MB (0 turns it off)')
+	download_parser.add_argument('--rate-limit', help='maximum bytes per second per download, e.g. 500K or 4.2M')
+	download_parser.add_argument('--buffer-size', type=int, help='download buffer size in KB')
+
+	for subparser in (convert_parser, watch_parser, download_parser):
+		subparser.add_argument('--format', help='output format, e.g. mp3 or mp4')
+		subparser.add_argument('--quality', help='quality option name or index within the format')
+		subparser.add_argument('--workers', type=int, help='number of parallel jobs')
+		subparser.add_argument('--server', help='submit the job to a job server instead of running it here')
+		subparser.add_argument('--priority', type=int, default=0, help='job server priority, higher runs first')
+		subparser.add_argument('--normalize-loudness', action=argparse.BooleanOptionalAction,
+			help='bring the audio to loudness_target in options.json with a two-pass EBU R128 loudnorm (default: loudness_normalization)')
+
+	cache_parser = subparsers.add_parser('cache', help='show or clear the conversion and loudness caches')
+	cache_parser.add_argument('--clear', action='store_true', help='delete every cached output and measurement and reset the statistics')
+
+	serve_parser = subparsers.add_parser('serve', help='run the local job server')
+	serve_parser.add_argument('--host', default='127.0.0.1')
+	serve_parser.add_argument('--port', type=int, default=8770)
+	serve_parser.add_argument('--workers', type=int, help='number of jobs running at the same time')
+
+	args = parser.parse_args(argv)
+	options = load_options(args.options)
+	performance_options = options.get("performance_options", {})
+	configure_metrics(dict(performance_options, metrics_log=args.metrics_log) if args.metrics_log else performance_options)
+	if args.command == 'serve':
+		return serve_command(options, args)
+	if args.command == 'cache':
+		return cache_command(options, args)
+
+	spec = job_spec(args)
+	if args.server:
+		return submit_command(spec, args)
+	try:
+		validate_job(options, spec)
+		return run_local_job(options, spec)
+	except ValueError as e:
+		raise SystemExit(str(e))
+
+
+if __name__ == '__main__':
+	sys.exit(main())
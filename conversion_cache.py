@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from contextlib import closing
+
+from converter import partial_output_path
+from download_archive import file_checksum
+from ffmpeg_process import ffmpeg_version
+
+
+
+STAT_NAMES = ('hits', 'misses', 'stored', 'evicted', 'reused_bytes')
+
+
+def open_conversion_cache(performance_options):
+	if not performance_options.get("conversion_cache", True):
+		return None
+	return ConversionCache(
+		os.path.join(os.getcwd(), "cache", "conversions.sqlite3"),
+		os.path.join(os.getcwd(), "cache", "conversions"),
+		(performance_options.get("conversion_cache_max_mb") or 2048) * 1024 * 1024,
+		performance_options.get("conversion_cache_key", "stat"))
+
+
+def source_key(input_media, key_mode='stat'):
+	# "stat" trusts path, size and mtime, "content" hashes the source so renamed or copied files hit too
+	if key_mode == 'content':
+		return file_checksum(input_media)
+	stat = os.stat(input_media)
+	return f'{os.path.abspath(input_media)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def link_or_copy(source, destination, partial_destination=None):
+	# Hardlinks make a hit free, copies are the fallback across drives and on filesystems without links
+	if os.path.exists(destination) and os.path.samefile(source, destination):
+		return
+	partial_destination = partial_destination or partial_output_path(destination)
+	if os.path.exists(partial_destination):
+		os.remove(partial_destination)
+	try:
+		try:
+			os.link(source, partial_destination)
+		except OSError:
+			shutil.copyfile(source, partial_destination)
+		os.replace(partial_destination, destination)
+	except OSError:
+		if os.path.exists(partial_destination):
+			os.remove(partial_destination)
+		raise
+
+
+
+class ConversionCache:
+	def __init__(self, path, directory, max_size=2048 * 1024 * 1024, key_mode='stat'):
+		self.path = path
+		self.directory = directory
+		self.max_size = max_size
+		self.key_mode = key_mode
+		self.lock = threading.Lock()
+
+		os.makedirs(directory, exist_ok=True)
+		with self.connect() as connection:
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute(
+				'CREATE TABLE IF NOT EXISTS entries ('
+				'key TEXT PRIMARY KEY, file TEXT NOT NULL, size INTEGER NOT NULL, '
+				'created REAL NOT NULL, last_access REAL NOT NULL)')
+			connection.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+
+	def connect(self):
+		return closing(sqlite3.connect(self.path, timeout=30))
+
+
+	def cache_key(self, input_media, ffmpeg_args, output_media):
+		output_extension = os.path.splitext(output_media)[1].lower()
+		return hashlib.sha256(json.dumps([source_key(input_media, self.key_mode), ffmpeg_args, output_extension, ffmpeg_version()]).encode('utf-8')).hexdigest()
+
+
+	def fetch(self, input_media, ffmpeg_args, output_media):
+		key = self.cache_key(input_media, ffmpeg_args, output_media)
+		with self.lock, self.connect() as connection:
+			row = connection.execute('SELECT file, size FROM entries WHERE key = ?', (key,)).fetchone()
+
+		# Copies across drives take a while, other workers keep using the cache meanwhile
+		if row is not None:
+			cached_media, size = row
+			try:
+				if os.path.getsize(cached_media) != size:
+					raise OSError("cached output changed on disk")
+				link_or_copy(cached_media, output_media)
+			except OSError:
+				with self.lock, self.connect() as connection, connection:
+					# Only if no other worker stored a fresh copy under the key meanwhile
+					if connection.execute('SELECT 1 FROM entries WHERE key = ? AND file = ? AND size = ?', (key, cached_media, size)).fetchone():
+						self.remove_entry(connection, key, cached_media)
+				row = None
+
+		with self.lock, self.connect() as connection, connection:
+			if row is None:
+				self.count(connection, misses=1)
+				return False
+
+			connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+			self.count(connection, hits=1, reused_bytes=size)
+		return True
+
+
+	def store(self, input_media, ffmpeg_args, output_media):
+		key = self.cache_key(input_media, ffmpeg_args, output_media)
+		extension = os.path.splitext(output_media)[1].lower()
+		cached_media = os.path.join(self.directory, key + extension)
+		size = os.path.getsize(output_media)
+		if size > self.max_size:
+			return
+
+		# Copied to a name of its own and renamed outside the lock, two workers storing the same key do not clash
+		link_or_copy(output_media, cached_media, os.path.join(self.directory, f'.{key}.{uuid.uuid4().hex}.part{extension}'))
+		now = time.time()
+		with self.lock, self.connect() as connection, connection:
+			connection.execute(
+				'INSERT OR REPLACE INTO entries (key, file, size, created, last_access) VALUES (?, ?, ?, ?, ?)',
+				(key, cached_media, size, now, now))
+			self.count(connection, stored=1)
+			self.evict(connection)
+
+
+	def evict(self, connection):
+		total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+		if total_size <= self.max_size:
+			return
+
+		# Drop the least recently used outputs until the cache fits its quota again
+		for key, cached_media, size in connection.execute('SELECT key, file, size FROM entries ORDER BY last_access').fetchall():
+			self.remove_entry(connection, key, cached_media)
+			self.count(connection, evicted=1)
+			total_size -= size
+			if total_size <= self.max_size:
+				break
+
+
+	def remove_entry(self, connection, key, cached_media):
+		connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+		try:
+			os.remove(cached_media)
+		except OSError:
+			pass
+
+
+	def count(self, connection, **counters):
+		for name, value in counters.items():
+			connection.execute(
+				'INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value', (name, value))
+
+
+	def stats(self):
+		with self.lock, self.connect() as connection:
+			stats = dict.fromkeys(STAT_NAMES, 0)
+			stats.update(connection.execute('SELECT name, value FROM stats').fetchall())
+			stats['entries'], stats['size'] = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+		lookups = stats['hits'] + stats['misses']
+		stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+		return stats
+
+
+	def clear(self):
+		with self.lock, self.connect() as connection, connection:
+			for key, cached_media in connection.execute('SELECT key, file FROM entries').fetchall():
+				self.remove_entry(connection, key, cached_media)
+			connection.execute('DELETE FROM stats')
+
+
+""" The class end here """
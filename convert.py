@@ -1,51 +1,97 @@
 import os
 import subprocess
 import threading
+import time
 
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QComboBox, QLineEdit, QVBoxLayout, QHBoxLayout, QTabWidget, QFileDialog, QMessageBox, QTextEdit
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QCheckBox, QComboBox, QLineEdit, QVBoxLayout, QHBoxLayout, QTabWidget, QFileDialog, QMessageBox, QSpinBox, QListWidget, QListWidgetItem
 from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QThread
+from cancellation import CancellationToken
+from conversion_cache import open_conversion_cache
+from converter import BatchConverter, conversion_output_path, remove_partial_output
+from loudness import loudness_options, open_loudness_normalizer
+from presets import find_quality_option, preset_ffmpeg_args
+from job_events import RemoteJobThread
+from job_journal import JobJournal, open_job_journal
+from progress_log import ProgressThrottle
+from progress_view import ProgressPanel
+from hot_folder import HotFolder
 
 
 
 class ConversionThread(QThread):
 	update_progress_signal = pyqtSignal(str)
 
-	def __init__(self, input_media_files, selected_quality_name, selected_quality_ffmpeg_args, output_media_files, parent=None):
+	def __init__(self, input_media_files, selected_quality_name, selected_quality_ffmpeg_args, output_media_files, max_workers=None, progress_interval=1.0, segments=0, segment_min_duration=600, conversion_cache=None, loudness=None, parent=None):
 		super().__init__(parent)
-		self.input_media_files = input_media_files
 		self.selected_quality_name = selected_quality_name
-		self.selected_quality_ffmpeg_args = selected_quality_ffmpeg_args
-		self.output_media_files = output_media_files
+		self.succeeded = None
+		self.cancel_token = CancellationToken()
+		self.batch_converter = BatchConverter(
+			input_media_files, selected_quality_ffmpeg_args, output_media_files, max_workers, progress_interval,
+			ProgressThrottle(self.update_progress_signal.emit, progress_interval),
+			self.cancel_token, segments, segment_min_duration, conversion_cache, loudness)
 
 	def run(self):
-		for input_media, output_media in zip(self.input_media_files, self.output_media_files):
-			ffmpeg_command = [
-			'ffmpeg',
-			'-i', input_media,
-			*self.selected_quality_ffmpeg_args.split(),
-			'-y',
-			output_media
-			]
+		completed_files = self.batch_converter.run()
+		# A stopped batch reports nothing, so its job stays unfinished and the missing files convert on the next start
+		if not self.cancel_token.cancelled:
+			self.succeeded = completed_files == len(self.batch_converter.input_media_files)
+
 
-			self.update_progress_signal.emit("Converting...")  # Emit a progress signal
-			subprocess.run(ffmpeg_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-			self.update_progress_signal.emit(f"Conversion finished for {input_media}")
+	def stop(self):
+		self.cancel_token.cancel()
 
 
 """ convertion thread class is end here"""
 
 
 
+class HotFolderThread(QThread):
+	update_progress_signal = pyqtSignal(str)
+
+	def __init__(self, folder, destination, quality_options, format_to_extension, performance_options=None, conversion_cache=None, max_workers=None, segments=0, parent=None):
+		super().__init__(parent)
+		self.cancel_token = CancellationToken()
+		self.hot_folder = HotFolder(
+			folder, destination, quality_options, format_to_extension, performance_options,
+			ProgressThrottle(self.update_progress_signal.emit, (performance_options or {}).get("progress_interval", 1.0)),
+			self.cancel_token, conversion_cache, workers=max_workers, segments=segments)
+
+	def run(self):
+		try:
+			self.hot_folder.run()
+		except Exception as e:
+			self.update_progress_signal.emit(f"Error: {str(e)}")
+
+
+	def stop(self):
+		self.cancel_token.cancel()
+
+
+""" The class end here """
+
+
+
 class MediaConversionTab(QWidget):
 	update_progress_signal = pyqtSignal(str)
 
-	def __init__(self, format_options, quality_options, format_to_extension):
+	def __init__(self, format_options, quality_options, format_to_extension, performance_options=None):
 		super().__init__()
 		self.format_options = format_options
 		self.quality_options = quality_options
 		self.format_to_extension = format_to_extension
+		self.performance_options = performance_options or {}
+		self.selected_media_files = []
+		self.job_journal = open_job_journal()
+		self.conversion_cache = open_conversion_cache(self.performance_options)
+		self.conversion_thread = None
+		self.conversion_job_id = None
+		self.pending_conversions = []
+		self.remote_jobs = []
+		self.remote_jobs_count = 0
+		self.watch_thread = None
 		self.initUI()
-		self.convert_thread = None
+		self.resume_interrupted_conversions()
 
 
 	def initUI(self):
@@ -102,6 +148,62 @@ class MediaConversionTab(QWidget):
 		self.update_combo_box2()
 		combo_layout.addWidget(self.combo_box2)
 
+		workers_label = QLabel("Parallel jobs:", self)
+		combo_layout.addWidget(workers_label)
+		self.workers_spin_box = QSpinBox(self)
+		self.workers_spin_box.setAccessibleName("Parallel jobs: ")
+		self.workers_spin_box.setToolTip("Number of files converted at the same time")
+		self.workers_spin_box.setRange(1, 256)
+		self.workers_spin_box.setValue(self.performance_options.get("conversion_workers") or os.cpu_count() or 1)
+		combo_layout.addWidget(self.workers_spin_box)
+		self.segmented_checkbox = QCheckBox("Split long videos across cores", self)
+		self.segmented_checkbox.setToolTip(
+			f"Encode videos longer than {self.performance_options.get('segment_min_duration', 600)} seconds as several segments at the same time and join them losslessly")
+		self.segmented_checkbox.setChecked(bool(self.performance_options.get("segmented_encoding")))
+		combo_layout.addWidget(self.segmented_checkbox)
+		self.loudness_checkbox = QCheckBox("Normalize loudness", self)
+		self.loudness_checkbox.setToolTip(
+			f"Measure each input once and bring it to {self.performance_options.get('loudness_target', -16)} LUFS (EBU R128), measurements are cached for later conversions")
+		self.loudness_checkbox.setChecked(bool(self.performance_options.get("loudness_normalization")))
+		combo_layout.addWidget(self.loudness_checkbox)
+
+
+        # Presets checked here are written by the same ffmpeg run, so each input is decoded only once
+		extra_presets_layout = QHBoxLayout()
+		extra_presets_label = QLabel("Also convert to:", self)
+		extra_presets_layout.addWidget(extra_presets_label)
+		self.extra_presets_list = QListWidget(self)
+		self.extra_presets_list.setAccessibleName("Also convert to: ")
+		self.extra_presets_list.setToolTip("Check more presets to write them in the same pass as the selected quality")
+		for selected_format in self.format_options:
+			for quality_option in self.quality_options.get(selected_format, []):
+				item = QListWidgetItem(f"{selected_format} {quality_option['name']}", self.extra_presets_list)
+				item.setData(Qt.UserRole, (selected_format, quality_option["name"]))
+				item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+				item.setCheckState(Qt.Unchecked)
+		self.extra_presets_list.setMaximumHeight(90)
+		extra_presets_layout.addWidget(self.extra_presets_list)
+
+
+        # Files dropped into the watched folder are converted with the presets selected above once they stop growing
+		watch_layout = QHBoxLayout()
+		watch_label = QLabel("Watch folder:", self)
+		watch_layout.addWidget(watch_label)
+		self.watch_edit = QLineEdit(self)
+		self.watch_edit.setAccessibleName("Watch folder: ")
+		self.watch_edit.setToolTip("Folder whose new files are converted automatically")
+		watch_layout.addWidget(self.watch_edit)
+		watch_browse_button = QPushButton("Browse...", self)
+		watch_browse_button.setAccessibleName("Browse for a folder to watch")
+		watch_browse_button.setToolTip("Browse for a folder to watch")
+		watch_browse_button.clicked.connect(self.browse_watch_folder)
+		watch_layout.addWidget(watch_browse_button)
+		self.watch_button = QPushButton("Start Watching", self)
+		self.watch_button.setAccessibleName("Start Watching")
+		self.watch_button.setToolTip("Convert every new file in the watched folder, and move it to its processed folder afterwards")
+		self.watch_button.clicked.connect(self.toggle_watch)
+		watch_layout.addWidget(self.watch_button)
+
 
         # Create a horizontal layout for the convert button and progress bar
 		button_layout = QHBoxLayout()
@@ -110,20 +212,24 @@ class MediaConversionTab(QWidget):
 		convert_button.setToolTip("Convert the selected content")
 		convert_button.clicked.connect(self.convert)
 		button_layout.addWidget(convert_button)
+		stop_button = QPushButton("Stop", self)
+		stop_button.setAccessibleName("Stop Conversion")
+		stop_button.setToolTip("Cancel the queued and running conversions, including the ones sent to the job server")
+		stop_button.clicked.connect(self.stop_conversions)
+		button_layout.addWidget(stop_button)
 		button_layout.setAlignment(Qt.AlignCenter)
 
-		self.progress_text = QTextEdit(self)
-		self.progress_text.setAccessibleName("Progress Info")
-		self.progress_text.setReadOnly(True)
-		button_layout.addWidget(self.progress_text)
+		self.progress_panel = ProgressPanel(self.performance_options, self)
 
 
         # Add layouts and widgets to the first tab layout
 		tab1_layout.addLayout(choose_media_layout)
 		tab1_layout.addLayout(dest_layout)
 		tab1_layout.addLayout(combo_layout)
+		tab1_layout.addLayout(extra_presets_layout)
+		tab1_layout.addLayout(watch_layout)
 		tab1_layout.addLayout(button_layout)
-		tab1_layout.addWidget(self.progress_text)
+		tab1_layout.addWidget(self.progress_panel)
 		self.setLayout(tab1_layout)
 
 
@@ -146,80 +252,230 @@ class MediaConversionTab(QWidget):
 			self.dest_edit.setText(folder_path)
 
 
+	def browse_watch_folder(self):
+		folder_path = QFileDialog.getExistingDirectory(self, "Select Folder to Watch", options=QFileDialog.ShowDirsOnly)
+		if folder_path:
+			self.watch_edit.setText(folder_path)
+
+
 	def update_combo_box2(self):
 		selected_option = self.combo_box1.currentText()
 		self.combo_box2.clear()
 		self.combo_box2.addItems([q["name"] for q in self.quality_options.get(selected_option, [])])
 
 
-	def stop_convert_thread(self):
-		if self.convert_thread and self.convert_thread.isRunning():
-			self.convert_thread.finished.connect(self.handle_thread_finished)
-			self.convert_thread.terminate()  # Terminate the thread to ensure it exits
-			self.convert_thread.wait()
+	def stop_conversions(self):
+		# Unlike closing the window, Stop cancels the jobs for good, so they do not resume on the next start
+		for job_id, _ in self.pending_conversions:
+			self.job_journal.set_state(job_id, JobJournal.CANCELLED)
+		self.pending_conversions.clear()
+		if self.conversion_thread:
+			self.job_journal.set_state(self.conversion_job_id, JobJournal.CANCELLED)
+			self.conversion_thread.stop()
+		for remote_job in self.remote_jobs:
+			remote_job.cancel()
+
+
+	def stop_convert_thread(self, timeout=None):
+		# The journal keeps the job unfinished, the next start converts whatever is still missing
+		self.pending_conversions.clear()
+		conversion_threads = [self.conversion_thread] + self.remote_jobs if self.conversion_thread else list(self.remote_jobs)
+		if self.watch_thread:
+			conversion_threads.append(self.watch_thread)
+		for conversion_thread in conversion_threads:
+			conversion_thread.stop()
+
+		if timeout is None:
+			timeout = self.performance_options.get("shutdown_timeout", 10)
+		deadline = time.monotonic() + timeout
+		for conversion_thread in conversion_threads:
+			if not conversion_thread.wait(max(int((deadline - time.monotonic()) * 1000), 0)):
+				conversion_thread.terminate()
+				conversion_thread.wait()
 
 
-	def handle_thread_finished(self):
-		self.convert_thread.finished.disconnect(self.handle_thread_finished)
-		self.convert_thread.wait()
+	def convert(self):
+		selected_presets = self.checked_presets()
+		if selected_presets is None:
+			return
 
+		self.destination = self.dest_edit.text()
 
-	def convert(self):
-		self.stop_convert_thread()
+		input_media_files = self.selected_media_files
+		if not input_media_files:
+			self.show_error("No media files selected")
+			return
 
+		if self.performance_options.get("job_server_url"):
+			self.submit_remote_conversion(input_media_files, selected_presets)
+			return
+
+		quality_options = [find_quality_option(self.quality_options, *preset) for preset in selected_presets]
+		output_media_files = [
+			[
+				conversion_output_path(self.destination, media, quality_option["name"], self.format_to_extension.get(quality_option["format"], 'mp4'))
+				for quality_option in quality_options
+			]
+			for media in input_media_files
+		]
+
+		spec = {
+			'media': input_media_files,
+			'outputs': output_media_files,
+			'quality': ', '.join(quality_option["name"] for quality_option in quality_options),
+			'ffmpeg_args': [preset_ffmpeg_args(quality_option) for quality_option in quality_options],
+			'workers': self.workers_spin_box.value(),
+			'segments': self.selected_segments(),
+			'normalize_loudness': self.loudness_checkbox.isChecked(),
+		}
+		self.pending_conversions.append((self.job_journal.add('convert', spec), spec))
+		if self.conversion_thread:
+			self.update_progress_text(f"Conversion of {len(input_media_files)} files queued until the running one finishes")
+		self.start_next_conversion()
+
+
+	def checked_presets(self):
 		selected_format = self.combo_box1.currentText()
 		selected_quality_index = self.combo_box2.currentIndex()
 
 		if selected_quality_index < 0:
 			self.show_error("Invalid quality option selected")
-			return
+			return None
 
 		selected_quality_options = self.quality_options.get(selected_format, [])
 
 		if selected_quality_index >= len(selected_quality_options):
 			self.show_error("Invalid quality option selected")
+			return None
+
+		return self.selected_presets(selected_format, selected_quality_options[selected_quality_index]["name"])
+
+
+	def toggle_watch(self):
+		if self.watch_thread:
+			self.watch_thread.stop()
 			return
 
-		self.destination = self.dest_edit.text()
+		folder = self.watch_edit.text()
+		if not os.path.isdir(folder):
+			self.show_error("Choose an existing folder to watch")
+			return
 
-		selected_quality_option = selected_quality_options[selected_quality_index]
-		selected_quality_name = selected_quality_option["name"]
-		selected_quality_ffmpeg_args = selected_quality_option["ffmpeg_args"]
+		selected_presets = self.checked_presets()
+		if selected_presets is None:
+			return
 
-		input_media_files = self.selected_media_files
-		output_extension = self.format_to_extension.get(selected_format, 'mp4')
-		output_media_base = f'{selected_quality_name}.{output_extension}'  # Common output base name
+		quality_options = [find_quality_option(self.quality_options, *preset) for preset in selected_presets]
+		try:
+			self.watch_thread = HotFolderThread(
+				folder, self.dest_edit.text(), quality_options, self.format_to_extension,
+				loudness_options(self.performance_options, self.loudness_checkbox.isChecked()), self.conversion_cache,
+				self.workers_spin_box.value(), self.selected_segments(), self)
+		except ValueError as e:
+			self.show_error(str(e))
+			return
 
-		output_media_files = [
-			os.path.join(self.destination, f'{os.path.splitext(os.path.basename(media))[0]}_{output_media_base}')
-			for media in input_media_files
-		]
+		self.progress_panel.add_job("hot folder", folder)
+		self.watch_thread.update_progress_signal.connect(lambda message: self.progress_panel.update_job("hot folder", message))
+		self.watch_thread.finished.connect(self.handle_watch_finished)
+		self.watch_button.setText("Stop Watching")
+		self.watch_button.setAccessibleName("Stop Watching")
+		self.watch_thread.start()
 
-		conversion_threads = [
-			ConversionThread(media, selected_quality_name, selected_quality_ffmpeg_args, output_media)
-			for media, output_media in zip(input_media_files, output_media_files)
-		]
 
-		conversion = ConversionThread(input_media_files, selected_quality_name, selected_quality_ffmpeg_args, output_media_files)
-		self.conversion_thread = conversion
-		self.conversion_thread.update_progress_signal.connect(self.update_progress_text)
-		if self.conversion_thread:
-			self.conversion_thread.finished.connect(self.handle_conversion_finished)
-			self.conversion_thread.start()
+	def handle_watch_finished(self):
+		self.watch_thread = None
+		self.watch_button.setText("Start Watching")
+		self.watch_button.setAccessibleName("Start Watching")
+
+
+	def selected_segments(self):
+		if not self.segmented_checkbox.isChecked():
+			return 0
+		return self.performance_options.get("segment_count") or os.cpu_count() or 1
+
+
+	def selected_presets(self, selected_format, selected_quality_name):
+		selected_presets = [(selected_format, selected_quality_name)]
+		for index in range(self.extra_presets_list.count()):
+			item = self.extra_presets_list.item(index)
+			preset = tuple(item.data(Qt.UserRole))
+			if item.checkState() == Qt.Checked and preset not in selected_presets:
+				selected_presets.append(preset)
+		return selected_presets
+
+
+	def start_next_conversion(self):
+		if self.conversion_thread or not self.pending_conversions:
+			return
+
+		self.conversion_job_id, spec = self.pending_conversions.pop(0)
+		self.job_journal.set_state(self.conversion_job_id, JobJournal.RUNNING)
+		self.conversion_thread = ConversionThread(spec['media'], spec['quality'], spec['ffmpeg_args'], spec['outputs'], spec['workers'],
+			self.performance_options.get("progress_interval", 1.0), spec.get('segments', 0), self.performance_options.get("segment_min_duration", 600),
+			self.conversion_cache, open_loudness_normalizer(loudness_options(self.performance_options, spec.get('normalize_loudness'))))
+		job_key = f"conversion #{self.conversion_job_id}"
+		self.progress_panel.add_job(job_key, f"{len(spec['media'])} files to {spec['quality']}")
+		self.conversion_thread.update_progress_signal.connect(lambda message, job_key=job_key: self.progress_panel.update_job(job_key, message))
+		self.conversion_thread.finished.connect(self.handle_conversion_finished)
+		self.conversion_thread.start()
+
+
+	def resume_interrupted_conversions(self):
+		for job_id, spec in self.job_journal.unfinished('convert'):
+			# Outputs only appear once complete, so any existing one is done and any partial one is dropped
+			outputs = [[output_media] if isinstance(output_media, str) else output_media for output_media in spec['outputs']]
+			remaining = [
+				(input_media, output_media_files) for input_media, output_media_files in zip(spec['media'], outputs)
+				if os.path.exists(input_media) and not all(os.path.exists(output_media) for output_media in output_media_files)
+			]
+			for _, output_media_files in remaining:
+				for output_media in output_media_files:
+					remove_partial_output(output_media)
+			if not remaining:
+				self.job_journal.set_state(job_id, JobJournal.COMPLETE)
+				continue
+
+			self.update_progress_text(f"Resuming an interrupted conversion: {len(remaining)} of {len(spec['media'])} files left")
+			spec['media'], spec['outputs'] = [list(files) for files in zip(*remaining)]
+			self.pending_conversions.append((job_id, spec))
+		self.start_next_conversion()
+
+
+	def submit_remote_conversion(self, input_media_files, selected_presets):
+		spec = {
+			'type': 'convert',
+			'media': input_media_files,
+			'presets': [f'{selected_format}/{selected_quality_name}' for selected_format, selected_quality_name in selected_presets],
+			'destination': self.destination,
+			'workers': self.workers_spin_box.value(),
+			'segments': self.selected_segments(),
+			'normalize_loudness': self.loudness_checkbox.isChecked(),
+		}
+		remote_job = RemoteJobThread(self.performance_options["job_server_url"], spec, parent=self)
+		self.remote_jobs_count += 1
+		job_key = f"server job {self.remote_jobs_count}"
+		self.progress_panel.add_job(job_key, f"{len(input_media_files)} files to {', '.join(spec['presets'])}")
+		remote_job.progress_signal.connect(lambda message, job_key=job_key: self.progress_panel.update_job(job_key, message))
+		remote_job.finished.connect(lambda remote_job=remote_job: self.remote_jobs.remove(remote_job))
+		self.remote_jobs.append(remote_job)
+		remote_job.start()
 
 
 	def handle_conversion_finished(self):
 		if self.conversion_thread:
 			self.conversion_thread.finished.disconnect(self.handle_conversion_finished)
+			if self.conversion_thread.succeeded is not None:
+				self.job_journal.set_state(self.conversion_job_id, JobJournal.COMPLETE if self.conversion_thread.succeeded else JobJournal.FAILED)
 			self.conversion_thread = None
+			self.conversion_job_id = None
+			self.start_next_conversion()
 
 
 
 	@pyqtSlot(str)
 	def update_progress_text(self, message):
-		if "Error" in message:
-			self.progress_text.clear()
-		self.progress_text.append(message)
+		self.progress_panel.log(message)
 
 
 	def show_error(self, message):
@@ -0,0 +1,343 @@
+import glob
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cancellation import CancellationToken, JobCancelled
+from media_probe import CONTAINER_CODECS, describe_media, stream_copy_args
+from ffmpeg_process import FfmpegError, FfmpegProcess, format_ffmpeg_progress
+from metrics import metrics
+from retry import ItemOutcomes
+
+
+
+# How far the joined output may drift from the input duration, relative to it
+SEGMENT_DURATION_TOLERANCE = 0.005
+
+CACHE_HIT = "conversion cache hit"
+
+
+
+def convert_media(input_media, ffmpeg_args, output_media, progress_callback=None, progress_interval=1.0, cancel_token=None):
+	return convert_media_outputs(input_media, [(ffmpeg_args, output_media)], progress_callback, progress_interval, cancel_token)[0]
+
+
+def convert_media_outputs(input_media, outputs, progress_callback=None, progress_interval=1.0, cancel_token=None):
+	"""Convert one input to several (ffmpeg_args, output_media) outputs in a single ffmpeg run, so it is decoded only once."""
+	if cancel_token:
+		cancel_token.raise_if_cancelled()
+
+	ffmpeg_command = ['ffmpeg', '-y', '-i', input_media]
+	decisions = []
+	for ffmpeg_args, output_media in outputs:
+		conversion_args, decision = stream_copy_args(input_media, ffmpeg_args, output_media)
+		# ffmpeg writes next to the final name and the file is renamed once complete, so an interrupted run never leaves a truncated output
+		ffmpeg_command += [*conversion_args, partial_output_path(output_media)]
+		decisions.append(decision)
+
+	ffmpeg_process = FfmpegProcess(ffmpeg_command, progress_callback, progress_interval, cancel_token)
+	try:
+		returncode = ffmpeg_process.run()
+	except JobCancelled:
+		for _, output_media in outputs:
+			remove_partial_output(output_media)
+		raise
+	if returncode != 0:
+		for _, output_media in outputs:
+			remove_partial_output(output_media)
+		raise FfmpegError(returncode, ffmpeg_process.stderr_tail)
+	for _, output_media in outputs:
+		os.replace(partial_output_path(output_media), output_media)
+	return decisions
+
+
+def run_ffmpeg(ffmpeg_command, progress_callback=None, progress_interval=1.0, cancel_token=None):
+	ffmpeg_process = FfmpegProcess(ffmpeg_command, progress_callback, progress_interval, cancel_token)
+	if ffmpeg_process.run() != 0:
+		raise FfmpegError(ffmpeg_process.returncode, ffmpeg_process.stderr_tail)
+
+
+def convert_media_segmented(input_media, ffmpeg_args, output_media, segments, min_duration=600, progress_callback=None, progress_interval=1.0, cancel_token=None):
+	"""Encode the video of a long input as keyframe aligned segments in parallel and join them with the concat demuxer."""
+	conversion_args, decision = stream_copy_args(input_media, ffmpeg_args, output_media)
+	duration, has_video, has_audio = describe_media(input_media)
+	extension = os.path.splitext(output_media)[1]
+	video_container = CONTAINER_CODECS.get(extension.lstrip('.').lower(), {'video': True})['video']
+	if segments < 2 or not has_video or not video_container or not duration or duration < min_duration or conversion_args == ['-c', 'copy']:
+		return convert_media(input_media, ffmpeg_args, output_media, progress_callback, progress_interval, cancel_token)
+
+	# A failed segment stops its siblings, a cancelled job stops all of them
+	segment_token = CancellationToken()
+	unregister = cancel_token.register(segment_token.cancel) if cancel_token else lambda: None
+	work_dir = tempfile.mkdtemp(prefix='.segments-', dir=os.path.dirname(os.path.abspath(output_media)))
+	try:
+		# Stream copy can only cut at keyframes, which is exactly where the encoded parts can be joined again
+		run_ffmpeg([
+			'ffmpeg', '-y', '-i', input_media, '-map', '0:v:0', '-c', 'copy',
+			'-f', 'segment', '-segment_time', f'{duration / segments:.3f}', '-reset_timestamps', '1',
+			os.path.join(work_dir, f'source%03d{extension}')
+		], cancel_token=segment_token)
+		source_segments = sorted(glob.glob(os.path.join(work_dir, f'source*{extension}')))
+		encoded_segments = [os.path.join(work_dir, f'encoded{index:03d}{extension}') for index in range(len(source_segments))]
+
+		segment_progress = SegmentProgress(duration, progress_callback, progress_interval)
+		ffmpeg_commands = [
+			(['ffmpeg', '-y', '-i', source_segment, *ffmpeg_args.split(), '-an', encoded_segment], segment_progress.callback(index))
+			for index, (source_segment, encoded_segment) in enumerate(zip(source_segments, encoded_segments))
+		]
+		# Audio is cheap to encode and would click at every join, so it is done in one piece next to the video
+		audio_media = os.path.join(work_dir, f'audio{extension}')
+		if has_audio:
+			audio_args = ['-vn', '-c:a', 'copy'] if '-c:a' in conversion_args else [*ffmpeg_args.split(), '-vn']
+			ffmpeg_commands.append((['ffmpeg', '-y', '-i', input_media, *audio_args, audio_media], None))
+
+		with ThreadPoolExecutor(max_workers=len(ffmpeg_commands)) as executor:
+			futures = [
+				executor.submit(run_ffmpeg, ffmpeg_command, callback, progress_interval, segment_token)
+				for ffmpeg_command, callback in ffmpeg_commands
+			]
+			for future in as_completed(futures):
+				if future.exception():
+					segment_token.cancel()
+			for future in futures:
+				future.result()
+
+		concat_list = os.path.join(work_dir, 'segments.txt')
+		with open(concat_list, 'w', encoding='utf-8') as file:
+			for encoded_segment in encoded_segments:
+				escaped_path = encoded_segment.replace("'", "'\\''")
+				file.write(f"file '{escaped_path}'\n")
+
+		partial_media = partial_output_path(output_media)
+		run_ffmpeg([
+			'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', concat_list,
+			*(['-i', audio_media, '-map', '0:v', '-map', '1:a'] if has_audio else []),
+			'-c', 'copy', partial_media
+		], cancel_token=segment_token)
+
+		joined_duration = describe_media(partial_media)[0]
+		if joined_duration is None or abs(joined_duration - duration) > max(1.0, duration * SEGMENT_DURATION_TOLERANCE):
+			raise RuntimeError(f"Joined output is {joined_duration or 0:.2f}s long but the input is {duration:.2f}s")
+		os.replace(partial_media, output_media)
+	except BaseException:
+		remove_partial_output(output_media)
+		if cancel_token and cancel_token.cancelled:
+			raise JobCancelled("Conversion cancelled")
+		raise
+	finally:
+		unregister()
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+	return f"{decision} in {len(source_segments)} parallel segments"
+
+
+def partial_output_path(output_media):
+	root, extension = os.path.splitext(output_media)
+	# The real extension stays last so ffmpeg still picks the right muxer
+	return f'{root}.part{extension}'
+
+
+def remove_partial_output(output_media):
+	try:
+		os.remove(partial_output_path(output_media))
+		return True
+	except OSError:
+		return False
+
+
+class SegmentProgress:
+	def __init__(self, duration, progress_callback, progress_interval):
+		self.duration = duration
+		self.progress_callback = progress_callback
+		self.progress_interval = progress_interval
+		self.segments = {}
+		self.last_report = 0
+		self.lock = threading.Lock()
+
+
+	def callback(self, index):
+		if not self.progress_callback:
+			return None
+		return lambda progress: self.update(index, progress)
+
+
+	def update(self, index, progress):
+		with self.lock:
+			self.segments[index] = progress
+			now = time.monotonic()
+			if now - self.last_report < self.progress_interval:
+				return
+			self.last_report = now
+			segments = list(self.segments.values())
+
+		out_time = sum(max(segment['out_time'], 0) for segment in segments)
+		speed = sum(segment['speed'] for segment in segments)
+		self.progress_callback({
+			'percent': min(out_time / self.duration * 100, 100.0),
+			'out_time': out_time,
+			'frame': sum(segment['frame'] for segment in segments),
+			'fps': sum(segment['fps'] for segment in segments),
+			'speed': speed,
+			'eta': max(self.duration - out_time, 0) / speed if speed > 0 else None,
+		})
+
+
+""" The class end here """
+
+
+def conversion_output_path(destination, input_media, selected_quality_name, output_extension):
+	return os.path.join(destination, f'{os.path.splitext(os.path.basename(input_media))[0]}_{selected_quality_name}.{output_extension}')
+
+
+def media_size(media):
+	try:
+		return os.path.getsize(media)
+	except OSError:
+		return 0
+
+
+
+class BatchConverter:
+	def __init__(self, input_media_files, ffmpeg_args, output_media_files, max_workers=None, progress_interval=1.0, log=print, cancel_token=None, segments=0, segment_min_duration=600, conversion_cache=None, loudness=None):
+		self.input_media_files = input_media_files
+		# A list of preset args converts every input to all of them in one run, each input then has one output per preset
+		self.ffmpeg_args = [ffmpeg_args] if isinstance(ffmpeg_args, str) else list(ffmpeg_args)
+		self.output_media_files = [[output_media] if isinstance(output_media, str) else list(output_media) for output_media in output_media_files]
+		self.max_workers = max_workers or os.cpu_count() or 1
+		self.progress_interval = progress_interval
+		self.log = log
+		self.cancel_token = cancel_token
+		self.segments = segments
+		self.segment_min_duration = segment_min_duration
+		self.conversion_cache = conversion_cache
+		self.loudness = loudness
+		self.outcomes = ItemOutcomes()
+
+
+	def run(self):
+		total_files = len(self.input_media_files)
+		workers = min(self.max_workers, total_files) or 1
+		presets = f" to {len(self.ffmpeg_args)} presets in one pass each" if len(self.ffmpeg_args) > 1 else ""
+		self.log(f"Converting {total_files} files{presets} with {workers} parallel jobs...")
+
+		start_time = time.monotonic()
+		completed_files = 0
+		completed_bytes = 0
+		cache_hits = 0
+
+		# ffmpeg does the heavy lifting in its own process, so plain threads are enough to keep every core busy
+		with ThreadPoolExecutor(max_workers=workers) as executor:
+			futures = {
+				executor.submit(self.convert_media, input_media, output_media): input_media
+				for input_media, output_media in zip(self.input_media_files, self.output_media_files)
+			}
+
+			for future in as_completed(futures):
+				input_media = futures[future]
+				# A corrupt input only fails its own conversion, the rest of the batch keeps going
+				try:
+					decisions = future.result()
+				except JobCancelled:
+					self.outcomes.record(input_media, ItemOutcomes.CANCELLED)
+					continue
+				except Exception as e:
+					self.outcomes.record(input_media, ItemOutcomes.FAILED, str(e))
+					self.log(f"Error converting {input_media}: {str(e)}")
+					continue
+
+				self.outcomes.record(input_media, ItemOutcomes.SUCCEEDED)
+				completed_files += 1
+				completed_bytes += media_size(input_media)
+				cache_hits += decisions.count(CACHE_HIT)
+				elapsed = max(time.monotonic() - start_time, 0.001)
+				files_per_minute = completed_files / elapsed * 60
+				megabytes_per_second = completed_bytes / elapsed / (1024 * 1024)
+				self.log(
+					f"Conversion finished for {input_media} by {', '.join(dict.fromkeys(decisions))} ({completed_files}/{total_files}, "
+					f"{files_per_minute:.1f} files/min, {megabytes_per_second:.2f} MB/s)")
+
+		elapsed = time.monotonic() - start_time
+		if self.conversion_cache:
+			stats = self.conversion_cache.stats()
+			self.log(
+				f"Conversion cache: {cache_hits} of {total_files * len(self.ffmpeg_args)} outputs reused, "
+				f"{stats['hit_rate']:.0%} hit rate overall, {stats['size'] / (1024 * 1024):.0f} MB in {stats['entries']} cached outputs")
+		if self.cancel_token and self.cancel_token.cancelled:
+			self.log(f"Conversion cancelled: {completed_files}/{total_files} files finished in {elapsed:.1f} seconds")
+			return completed_files
+		self.log(f"All conversions finished: {completed_files}/{total_files} files in {elapsed:.1f} seconds")
+		self.log(self.outcomes.summary())
+		return completed_files
+
+
+	def convert_media(self, input_media, output_media_files):
+		start_time = time.monotonic()
+		result = 'failed'
+		try:
+			decisions = self.convert_outputs(input_media, output_media_files)
+			result = 'cached' if all(decision == CACHE_HIT for decision in decisions) else 'converted'
+			return decisions
+		except JobCancelled:
+			result = 'cancelled'
+			raise
+		finally:
+			seconds = time.monotonic() - start_time
+			metrics.observe('oni_conversion_seconds', seconds, result=result)
+			metrics.event(
+				'conversion', input=input_media, outputs=output_media_files, result=result, seconds=round(seconds, 3),
+				input_bytes=media_size(input_media))
+
+
+	def convert_outputs(self, input_media, output_media_files):
+		outputs = list(zip(self.ffmpeg_args, output_media_files))
+		decisions = {}
+		if self.conversion_cache:
+			for ffmpeg_args, output_media in outputs:
+				try:
+					if self.conversion_cache.fetch(input_media, self.cache_args(ffmpeg_args), output_media):
+						decisions[output_media] = CACHE_HIT
+				except (OSError, sqlite3.Error) as e:
+					self.log(f"Conversion cache lookup failed for {input_media}: {str(e)}")
+
+		outputs_to_convert = [(ffmpeg_args, output_media) for ffmpeg_args, output_media in outputs if output_media not in decisions]
+		if outputs_to_convert:
+			conversion_decisions = self.transcode(input_media, outputs_to_convert)
+			for (ffmpeg_args, output_media), decision in zip(outputs_to_convert, conversion_decisions):
+				decisions[output_media] = decision
+				if self.conversion_cache:
+					try:
+						self.conversion_cache.store(input_media, self.cache_args(ffmpeg_args), output_media)
+					except (OSError, sqlite3.Error) as e:
+						self.log(f"Could not add {output_media} to the conversion cache: {str(e)}")
+		return [decisions[output_media] for _, output_media in outputs]
+
+
+	def cache_args(self, ffmpeg_args):
+		return self.loudness.cache_args(ffmpeg_args) if self.loudness else ffmpeg_args
+
+
+	def transcode(self, input_media, outputs):
+		media_name = os.path.basename(input_media)
+		progress_callback = lambda progress: self.log(format_ffmpeg_progress(media_name, progress))
+		if self.loudness:
+			# The analysis pass runs in this worker, next to the other inputs of the pool, and once for all presets
+			measurement, cached = self.loudness.measure(
+				input_media, self.log, lambda progress: self.log(format_ffmpeg_progress(f"{media_name} (loudness analysis)", progress)),
+				self.progress_interval, self.cancel_token)
+			self.log(self.loudness.describe(media_name, measurement, cached))
+			outputs = [(self.loudness.ffmpeg_args(ffmpeg_args, measurement), output_media) for ffmpeg_args, output_media in outputs]
+		# Splitting into segments only pays off for one output, several presets already keep ffmpeg busy
+		if self.segments > 1 and len(outputs) == 1:
+			ffmpeg_args, output_media = outputs[0]
+			return [convert_media_segmented(
+				input_media, ffmpeg_args, output_media, self.segments, self.segment_min_duration,
+				progress_callback, self.progress_interval, self.cancel_token)]
+		return convert_media_outputs(input_media, outputs, progress_callback, self.progress_interval, self.cancel_token)
+
+
+""" The class end here """
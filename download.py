@@ -1,12 +1,22 @@
 import os
 import subprocess
-import yt_dlp as youtube_dl
-import re
 import threading
 import time
 
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QCheckBox, QComboBox, QLineEdit, QVBoxLayout, QHBoxLayout, QTabWidget, QFileDialog, QMessageBox, QTextEdit
+from collections import deque
+
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QCheckBox, QComboBox, QLineEdit, QVBoxLayout, QHBoxLayout, QTabWidget, QFileDialog, QMessageBox, QSpinBox
 from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QThread
+from cancellation import CancellationToken, JobCancelled
+from downloader import Downloader, build_ydl_opts, open_metadata_cache, open_download_archive, open_fragment_tuner, parse_rate_limit, url_host
+from loudness import loudness_options
+from presets import find_quality_option, download_format
+from job_events import RemoteJobThread
+from job_journal import JobJournal, open_job_journal
+from metrics import metrics
+from retry import ItemOutcomes, error_text
+from progress_log import ProgressThrottle
+from progress_view import ProgressPanel
 
 
 
@@ -14,88 +24,38 @@ from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QThread
 class DownloadThread(QThread):
 	progress_signal = pyqtSignal(str)
 
-	def __init__(self, url, ydl_opts, combo_box1, combo_box2, destination, format_options, quality_options, format_to_extension, playlist, parent=None):
+	def __init__(self, url, ydl_opts, selected_quality_option, destination, format_to_extension, playlist, performance_options=None, metadata_cache=None, refresh_metadata=False, download_archive=None, fragment_tuner=None, parent=None):
 		super().__init__(parent)
 		self.url = url
-		self.ydl_opts = ydl_opts
-		self.combo_box1 = combo_box1
-		self.combo_box2 = combo_box2
-		self.destination = destination
-		self.format_options = format_options
-		self.quality_options = quality_options
-		self.format_to_extension = format_to_extension
-		self.playlist_checkbox = playlist
-		self.conversion_thread = None  
+		self.succeeded = None
+		self.error = None
+		self.cancel_token = CancellationToken()
+		self.resume = True
+		# yt-dlp calls its progress hooks for every chunk, far more often than anyone can read
+		progress_log = ProgressThrottle(self.progress_signal.emit, (performance_options or {}).get("progress_interval", 1.0))
+		self.downloader = Downloader(
+			url, ydl_opts, selected_quality_option, destination, format_to_extension, playlist, performance_options,
+			metadata_cache, refresh_metadata, download_archive, progress_log, self.cancel_token, fragment_tuner)
 
 
 	def run(self):
 		try:
-			self.download_video()
+			self.downloader.run()
+			failed_entries = self.downloader.outcomes.count(ItemOutcomes.FAILED)
+			self.succeeded = not failed_entries
+			if failed_entries:
+				self.error = f"{failed_entries} playlist entries failed"
+		except JobCancelled:
+			self.progress_signal.emit("Download stopped, it resumes on the next start" if self.resume else "Download cancelled")
 		except Exception as e:
-			self.progress_signal.emit(f"Error: {str(e)}")
-
-
-	def download_video(self):
-		def progress_hook(d):
-			if d['status'] == 'downloading':
-				percent = d['_percent_str'].replace('\x1b[0;94m', '').replace('\x1b[0m', '')
-				speed = d['_speed_str'].replace('\x1b[0;32m', '').replace('\x1b[0m', '')
-				eta = d['_eta_str'].replace('\x1b[0;33m', '').replace('\x1b[0m', '')
-				message = f"Downloading: {percent} ({speed}, ETA: {eta})"
-				self.progress_signal.emit(message)
-
-		self.ydl_opts['progress_hooks'] = [progress_hook]
-
-		with youtube_dl.YoutubeDL(self.ydl_opts) as ydl:
-			info_dict = ydl.extract_info(self.url, download=False)
-			video_title = info_dict.get('title', 'video')
-			video_title_safe = re.sub(r'[\/:*?"<>|&%@]', '_', video_title)
-			input_media = os.path.join(self.destination, f'{video_title_safe}.mp4')
-
-			if self.playlist_checkbox.isChecked():
-				self.progress_signal.emit("Fetching a playlist data...")
-				ydl.download([self.url])
-				self.progress_signal.emit("Download completed successfully.")
-			else:
-				ydl.download([self.url])
-				self.progress_signal.emit("Download completed successfully.")
-				self.progress_signal.emit("Converting...")
-				self.convert_video(input_media, video_title)
-
-
-	def convert_video(self, input_media, video_title):
-		selected_format = self.combo_box1.currentText()
-		selected_quality_index = self.combo_box2.currentIndex()
-
-		if selected_quality_index < 0:
-			self.show_error("Invalid quality option selected")
-			return
-
-		selected_quality_options = self.quality_options.get(selected_format, [])
-
-		if selected_quality_index >= len(selected_quality_options):
-			self.show_error("Invalid quality option selected")
-			return
-
-		selected_quality_option = selected_quality_options[selected_quality_index]
-		selected_quality_name = selected_quality_option["name"]
-		selected_quality_ffmpeg_args = selected_quality_option["ffmpeg_args"]
+			self.succeeded = False
+			self.error = error_text(e)
+			self.progress_signal.emit(f"Error: {self.error}")
 
-		output_extension = self.format_to_extension.get(selected_format, 'mp4')
-		output_media = os.path.join(self.destination, f'{video_title}.{selected_quality_name}.{output_extension}')
 
-		conversion = ConversionThread(input_media, selected_quality_name, selected_quality_ffmpeg_args, output_media)
-		self.conversion_thread = conversion
-		if self.conversion_thread:
-			self.conversion_thread.finished.connect(self.handle_conversion_finished)
-			conversion.start()
-
-
-	def handle_conversion_finished(self):
-		if self.conversion_thread:
-			self.conversion_thread.finished.disconnect(self.handle_conversion_finished)
-			self.conversion_thread = None
-			self.progress_signal.emit("Successfully converted")
+	def stop(self, resume=True):
+		self.resume = resume
+		self.cancel_token.cancel()
 
 
 """ Download thread is end here """
@@ -103,51 +63,30 @@ class DownloadThread(QThread):
 
 
 
-
-class ConversionThread(QThread):
-	def __init__(self, input_media, selected_quality_name, selected_quality_ffmpeg_args, output_media, parent=None):
-		super().__init__(parent)
-		self.input_media = input_media
-		self.selected_quality_name = selected_quality_name
-		self.selected_quality_ffmpeg_args = selected_quality_ffmpeg_args
-		self.output_media = output_media
-
-	def run(self):
-		ffmpeg_command = [
-			'ffmpeg',
-			'-i', self.input_media,
-			*self.selected_quality_ffmpeg_args.split(),
-			'-y',
-			self.output_media
-		]
-
-		subprocess.run(ffmpeg_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-		time.sleep(2)
-		self.remove_input_media()
-
-
-	def remove_input_media(self):
-		try:
-			os.remove(self.input_media)
-		except Exception as e:
-			print(f"Error removing input media: {str(e)}")
-
-
-""" Convertion thread is end here """
-
-
-
-
 class DownloadTab(QWidget):
 	update_progress_signal = pyqtSignal(str)
 
-	def __init__(self, format_options, quality_options, format_to_extension):
+	def __init__(self, format_options, quality_options, format_to_extension, performance_options=None, format_to_download_format=None):
 		super().__init__()
 		self.format_options = format_options
 		self.quality_options = quality_options
 		self.format_to_extension = format_to_extension
+		self.performance_options = performance_options or {}
+		self.format_to_download_format = format_to_download_format or {}
+		self.pending_downloads = deque()
+		self.running_downloads = []
+		self.queued_downloads_count = 0
+		self.remote_jobs_count = 0
+		self.download_outcomes = ItemOutcomes()
+		self.metadata_cache = open_metadata_cache(self.performance_options)
+		self.download_archive = open_download_archive()
+		self.fragment_tuner = open_fragment_tuner(self.performance_options)
+		self.remote_jobs = []
+		self.job_journal = open_job_journal()
+		self.job_journal.prune()
 		self.initUI()
 		self.download_thread = None
+		self.resume_interrupted_downloads()
 
 
 	def initUI(self):
@@ -161,8 +100,13 @@ class DownloadTab(QWidget):
 		url_layout.addWidget(url_label)
 		self.url_edit = QLineEdit(self)
 		self.url_edit.setAccessibleName("Enter the URL here")
-		self.url_edit.setToolTip("Enter the URL here")
+		self.url_edit.setToolTip("Enter one or more URLs separated by spaces or new lines")
 		url_layout.addWidget(self.url_edit)
+		load_urls_button = QPushButton("Load URL List...", self)
+		load_urls_button.setAccessibleName("Load URL List...")
+		load_urls_button.setToolTip("Add every URL from a text file to the download queue")
+		load_urls_button.clicked.connect(self.load_url_list)
+		url_layout.addWidget(load_urls_button)
 		clear_button = QPushButton("Clear", self)
 		clear_button.setAccessibleName("Clear")
 		clear_button.setToolTip("Clear the URL input")
@@ -197,10 +141,21 @@ class DownloadTab(QWidget):
 		self.single_file_checkbox = QCheckBox("Download and Convert a Single File", self)
 		self.single_file_checkbox.setChecked(True)  
 		self.single_file_checkbox.toggled.connect(self.handle_single_file_checkbox)
-		self.playlist_checkbox = QCheckBox("Playlist download (No conversion process)", self)
+		self.playlist_checkbox = QCheckBox("Download and Convert a Playlist", self)
 		self.playlist_checkbox.toggled.connect(self.handle_playlist_checkbox)
 		options_layout.addWidget(self.single_file_checkbox)
 		options_layout.addWidget(self.playlist_checkbox)
+		self.refresh_metadata_checkbox = QCheckBox("Refresh cached metadata", self)
+		self.refresh_metadata_checkbox.setToolTip("Resolve the URLs again instead of using the stored titles, formats and playlist entries")
+		options_layout.addWidget(self.refresh_metadata_checkbox)
+		self.sync_archive_checkbox = QCheckBox("Sync playlist with download archive", self)
+		self.sync_archive_checkbox.setToolTip("Skip playlist entries that were already downloaded and converted, and repair missing or truncated outputs")
+		options_layout.addWidget(self.sync_archive_checkbox)
+		self.loudness_checkbox = QCheckBox("Normalize loudness", self)
+		self.loudness_checkbox.setToolTip(
+			f"Measure each download and bring it to {self.performance_options.get('loudness_target', -16)} LUFS (EBU R128) while converting")
+		self.loudness_checkbox.setChecked(bool(self.performance_options.get("loudness_normalization")))
+		options_layout.addWidget(self.loudness_checkbox)
 
 		combo_layout = QHBoxLayout()
 		combo_label1 = QLabel("Format:", self)
@@ -218,6 +173,58 @@ class DownloadTab(QWidget):
 		self.update_combo_box2()
 		combo_layout.addWidget(self.combo_box2)
 
+		downloads_label = QLabel("Parallel downloads:", self)
+		combo_layout.addWidget(downloads_label)
+		self.downloads_spin_box = QSpinBox(self)
+		self.downloads_spin_box.setAccessibleName("Parallel downloads: ")
+		self.downloads_spin_box.setToolTip("Number of queued URLs downloaded at the same time")
+		self.downloads_spin_box.setRange(1, 64)
+		self.downloads_spin_box.setValue(self.performance_options.get("max_concurrent_downloads") or 1)
+		self.downloads_spin_box.valueChanged.connect(self.start_queued_downloads)
+		combo_layout.addWidget(self.downloads_spin_box)
+
+		acceleration_layout = QHBoxLayout()
+		fragments_label = QLabel("Fragments:", self)
+		acceleration_layout.addWidget(fragments_label)
+		self.fragments_spin_box = QSpinBox(self)
+		self.fragments_spin_box.setAccessibleName("Fragments: ")
+		self.fragments_spin_box.setToolTip("Number of HLS and DASH fragments downloaded at the same time")
+		self.fragments_spin_box.setRange(1, 64)
+		self.fragments_spin_box.setValue(self.performance_options.get("concurrent_fragments") or 1)
+		acceleration_layout.addWidget(self.fragments_spin_box)
+		self.auto_tune_checkbox = QCheckBox("Auto-tune", self)
+		self.auto_tune_checkbox.setToolTip("Measure the first seconds of every download and raise or lower the fragments for the next one from the same site")
+		self.auto_tune_checkbox.setChecked(bool(self.performance_options.get("auto_tune_fragments")))
+		acceleration_layout.addWidget(self.auto_tune_checkbox)
+
+		chunk_size_label = QLabel("Chunk size (MB):", self)
+		acceleration_layout.addWidget(chunk_size_label)
+		self.chunk_size_spin_box = QSpinBox(self)
+		self.chunk_size_spin_box.setAccessibleName("Chunk size in megabytes: ")
+		self.chunk_size_spin_box.setToolTip("Download plain files in ranged requests of this size, for sites that throttle long responses")
+		self.chunk_size_spin_box.setRange(0, 1024)
+		self.chunk_size_spin_box.setSpecialValueText("Off")
+		self.chunk_size_spin_box.setValue(self.performance_options.get("http_chunk_size_mb") or 0)
+		acceleration_layout.addWidget(self.chunk_size_spin_box)
+
+		rate_limit_label = QLabel("Rate limit:", self)
+		acceleration_layout.addWidget(rate_limit_label)
+		self.rate_limit_edit = QLineEdit(self.performance_options.get("download_rate_limit") or "", self)
+		self.rate_limit_edit.setAccessibleName("Rate limit: ")
+		self.rate_limit_edit.setToolTip("Maximum download speed per download in bytes per second, like 500K or 4.2M, empty for no limit")
+		self.rate_limit_edit.setPlaceholderText("Unlimited")
+		acceleration_layout.addWidget(self.rate_limit_edit)
+
+		buffer_size_label = QLabel("Buffer (KB):", self)
+		acceleration_layout.addWidget(buffer_size_label)
+		self.buffer_size_spin_box = QSpinBox(self)
+		self.buffer_size_spin_box.setAccessibleName("Buffer size in kilobytes: ")
+		self.buffer_size_spin_box.setToolTip("Size of the download buffer")
+		self.buffer_size_spin_box.setRange(0, 65536)
+		self.buffer_size_spin_box.setSpecialValueText("Default")
+		self.buffer_size_spin_box.setValue(self.performance_options.get("download_buffer_kb") or 0)
+		acceleration_layout.addWidget(self.buffer_size_spin_box)
+
 
         # Create a horizontal layout for the download button and progress bar
 		button_layout = QHBoxLayout()
@@ -226,12 +233,14 @@ class DownloadTab(QWidget):
 		download_button.setToolTip("Download the selected content")
 		download_button.clicked.connect(self.download)
 		button_layout.addWidget(download_button)
+		stop_button = QPushButton("Stop", self)
+		stop_button.setAccessibleName("Stop Downloads")
+		stop_button.setToolTip("Cancel the queued and running downloads, including the ones sent to the job server")
+		stop_button.clicked.connect(self.stop_downloads)
+		button_layout.addWidget(stop_button)
 		button_layout.setAlignment(Qt.AlignCenter)
 
-		self.progress_text = QTextEdit(self)
-		self.progress_text.setAccessibleName("Progress Info")
-		self.progress_text.setReadOnly(True)
-		button_layout.addWidget(self.progress_text)
+		self.progress_panel = ProgressPanel(self.performance_options, self)
 
 
         # Add layouts and widgets to the first tab layout
@@ -239,8 +248,9 @@ class DownloadTab(QWidget):
 		tab1_layout.addLayout(dest_layout)
 		tab1_layout.addLayout(options_layout)
 		tab1_layout.addLayout(combo_layout)
+		tab1_layout.addLayout(acceleration_layout)
 		tab1_layout.addLayout(button_layout)
-		tab1_layout.addWidget(self.progress_text)
+		tab1_layout.addWidget(self.progress_panel)
 		self.setLayout(tab1_layout)
 
 
@@ -271,10 +281,6 @@ class DownloadTab(QWidget):
 	def handle_playlist_checkbox(self, checked):
 		if checked:
 			self.single_file_checkbox.setChecked(False)
-			self.combo_box1.clear()
-			self.combo_box1.addItem(".mp4")
-			self.combo_box2.clear()
-			self.combo_box2.addItem("best")
 
 
 	def update_combo_box2(self):
@@ -283,47 +289,210 @@ class DownloadTab(QWidget):
 		self.combo_box2.addItems([q["name"] for q in self.quality_options.get(selected_option, [])])
 
 
-	def stop_download_thread(self):
-		if self.download_thread and self.download_thread.isRunning():
-			self.download_thread.finished.connect(self.handle_thread_finished)
-			self.download_thread.terminate()  # Terminate the thread to ensure it exits
-			self.download_thread.wait()
-
+	def stop_downloads(self):
+		# Unlike closing the window, Stop cancels the jobs for good, so they do not resume on the next start
+		for download_thread in [*self.pending_downloads, *self.running_downloads]:
+			self.job_journal.set_state(download_thread.job_id, JobJournal.CANCELLED)
+			download_thread.stop(resume=False)
+		self.pending_downloads.clear()
+		for remote_job in self.remote_jobs:
+			remote_job.cancel()
+
+
+	def stop_download_thread(self, timeout=None):
+		# Queued and running jobs stay in the journal, and server jobs keep running without this window
+		self.pending_downloads.clear()
+		download_threads = self.running_downloads + self.remote_jobs
+		for download_thread in download_threads:
+			download_thread.stop()
+
+		if timeout is None:
+			timeout = self.performance_options.get("shutdown_timeout", 10)
+		deadline = time.monotonic() + timeout
+		for download_thread in download_threads:
+			if not download_thread.wait(max(int((deadline - time.monotonic()) * 1000), 0)):
+				# Last resort for a thread stuck outside of yt-dlp's progress hooks
+				download_thread.terminate()
+				download_thread.wait()
+
+
+	def handle_thread_finished(self, download_thread):
+		if download_thread in self.running_downloads:
+			self.running_downloads.remove(download_thread)
+		# A terminated thread never got to report, its job stays unfinished and resumes on the next start
+		if download_thread.succeeded is not None:
+			self.job_journal.set_state(download_thread.job_id, JobJournal.COMPLETE if download_thread.succeeded else JobJournal.FAILED)
+		self.download_outcomes.retried(download_thread.url, download_thread.downloader.outcomes.total_retries())
+		if download_thread.succeeded is None:
+			self.download_outcomes.record(download_thread.url, ItemOutcomes.CANCELLED)
+		elif download_thread.succeeded:
+			self.download_outcomes.record(download_thread.url, ItemOutcomes.SUCCEEDED)
+		else:
+			self.download_outcomes.record(download_thread.url, ItemOutcomes.FAILED, download_thread.error)
+		download_thread.wait()
+		self.start_queued_downloads()
+
+		# Once the queue runs dry, sum up the batch and start counting afresh for the next one
+		if not self.running_downloads and not self.pending_downloads:
+			self.update_progress_text(self.download_outcomes.summary())
+			self.download_outcomes = ItemOutcomes()
+
+
+	def load_url_list(self):
+		file_path, _ = QFileDialog.getOpenFileName(self, "Choose URL List", "", "Text Files (*.txt);;All Files (*)")
+		if not file_path:
+			return
 
-	def handle_thread_finished(self):
-		self.download_thread.finished.disconnect(self.handle_thread_finished)
-		self.download_thread.wait()
+		with open(file_path, 'r', encoding='utf-8') as file:
+			urls = [line.strip() for line in file if line.strip() and not line.strip().startswith('#')]
+		self.enqueue_downloads(urls)
 
 
 	def download(self):
-		url = self.url_edit.text()
-		if not url:
+		urls = self.url_edit.text().split()
+		if not urls:
 			return
 
+		self.enqueue_downloads(urls)
+
+
+	def enqueue_downloads(self, urls):
 		destination = self.dest_edit.text()
 		if not destination:
 			return
 
-		self.stop_download_thread()
+		# Settings are captured now so queued items keep them even if the widgets change later
+		selected_quality_option = find_quality_option(self.quality_options, self.combo_box1.currentText(), self.combo_box2.currentIndex())
+		if selected_quality_option is None:
+			self.show_error("Invalid quality option selected")
+			return
+
+		acceleration = self.download_acceleration()
+		try:
+			parse_rate_limit(acceleration["download_rate_limit"])
+		except ValueError as e:
+			self.show_error(str(e))
+			return
 
-		ydl_opts = {
-			'format': 'best',
-			'outtmpl': os.path.join(destination, '%(title)s.%(ext)s'),
-			'yes-playlist': self.playlist_checkbox.isChecked(),
+		playlist = self.playlist_checkbox.isChecked()
+		if self.performance_options.get("job_server_url"):
+			self.submit_remote_download(urls, destination, selected_quality_option, playlist, acceleration)
+			return
+
+		for url in urls:
+			spec = {
+				'url': url,
+				'destination': destination,
+				'format': selected_quality_option["format"],
+				'quality': selected_quality_option["name"],
+				'playlist': playlist,
+				'refresh_metadata': self.refresh_metadata_checkbox.isChecked(),
+				'sync': self.sync_archive_checkbox.isChecked(),
+				'acceleration': acceleration,
+				'normalize_loudness': self.loudness_checkbox.isChecked(),
+			}
+			self.queue_download(self.job_journal.add('download', spec), spec, selected_quality_option)
+
+		self.update_progress_text(f"Added {len(urls)} URLs to the download queue ({len(self.pending_downloads)} waiting, {len(self.running_downloads)} running)")
+		self.start_queued_downloads()
+
+
+	def download_acceleration(self):
+		return {
+			'concurrent_fragments': self.fragments_spin_box.value(),
+			'auto_tune_fragments': self.auto_tune_checkbox.isChecked(),
+			'http_chunk_size_mb': self.chunk_size_spin_box.value(),
+			'download_rate_limit': self.rate_limit_edit.text().strip(),
+			'download_buffer_kb': self.buffer_size_spin_box.value(),
 		}
 
 
-		self.download_thread = DownloadThread(
-			url, ydl_opts, self.combo_box1, self.combo_box2, destination, self.format_options, self.quality_options, self.format_to_extension, self.playlist_checkbox, self)
-		self.download_thread.progress_signal.connect(self.update_progress_text)
-		self.download_thread.start()
+	def queue_download(self, job_id, spec, selected_quality_option):
+		selected_download_format = download_format(self.format_to_download_format, selected_quality_option)
+		# Jobs journaled before these settings existed use the ones from options.json
+		performance_options = loudness_options(dict(self.performance_options, **(spec.get('acceleration') or {})), spec.get('normalize_loudness'))
+		ydl_opts = build_ydl_opts(spec['destination'], selected_download_format, spec['playlist'], performance_options)
+
+		self.queued_downloads_count += 1
+		download_thread = DownloadThread(
+			spec['url'], ydl_opts, selected_quality_option, spec['destination'], self.format_to_extension, spec['playlist'], performance_options,
+			self.metadata_cache, spec['refresh_metadata'], self.download_archive if spec['sync'] else None, self.fragment_tuner, self)
+		download_thread.job_id = job_id
+		download_thread.queued_at = time.monotonic()
+		download_thread.queue_number = self.queued_downloads_count
+		self.progress_panel.add_job(f"#{download_thread.queue_number}", spec['url'])
+		download_thread.progress_signal.connect(
+			lambda message, queue_number=download_thread.queue_number: self.progress_panel.update_job(f"#{queue_number}", message))
+		download_thread.finished.connect(lambda download_thread=download_thread: self.handle_thread_finished(download_thread))
+		self.pending_downloads.append(download_thread)
+
+
+	def resume_interrupted_downloads(self):
+		resumed_downloads = 0
+		for job_id, spec in self.job_journal.unfinished('download'):
+			selected_quality_option = find_quality_option(self.quality_options, spec['format'], spec['quality'])
+			if selected_quality_option is None:
+				self.job_journal.set_state(job_id, JobJournal.FAILED)
+				continue
+			self.queue_download(job_id, spec, selected_quality_option)
+			resumed_downloads += 1
+
+		if resumed_downloads:
+			self.update_progress_text(f"Resuming {resumed_downloads} interrupted downloads, partial files are continued where they stopped")
+			self.start_queued_downloads()
+
+
+	def submit_remote_download(self, urls, destination, selected_quality_option, playlist, acceleration):
+		# The job server does its own queueing and per-host scheduling
+		spec = {
+			'type': 'download',
+			'urls': urls,
+			'format': selected_quality_option["format"],
+			'quality': selected_quality_option["name"],
+			'destination': destination,
+			'workers': self.downloads_spin_box.value(),
+			'playlist': playlist,
+			'sync': self.sync_archive_checkbox.isChecked(),
+			'refresh_metadata': self.refresh_metadata_checkbox.isChecked(),
+			'acceleration': acceleration,
+			'normalize_loudness': self.loudness_checkbox.isChecked(),
+		}
+		remote_job = RemoteJobThread(self.performance_options["job_server_url"], spec, parent=self)
+		self.remote_jobs_count += 1
+		job_key = f"server job {self.remote_jobs_count}"
+		self.progress_panel.add_job(job_key, f"{len(urls)} URLs")
+		remote_job.progress_signal.connect(lambda message, job_key=job_key: self.progress_panel.update_job(job_key, message))
+		remote_job.finished.connect(lambda remote_job=remote_job: self.remote_jobs.remove(remote_job))
+		self.remote_jobs.append(remote_job)
+		remote_job.start()
+
+
+	def start_queued_downloads(self):
+		max_downloads = self.downloads_spin_box.value()
+		max_per_host = self.performance_options.get("max_downloads_per_host") or max_downloads
+
+		# Start the oldest waiting URLs whose host still has a free connection slot
+		for download_thread in list(self.pending_downloads):
+			if len(self.running_downloads) >= max_downloads:
+				break
+
+			host = url_host(download_thread.url)
+			host_downloads = sum(1 for running_thread in self.running_downloads if url_host(running_thread.url) == host)
+			if host_downloads >= max_per_host:
+				continue
+
+			self.pending_downloads.remove(download_thread)
+			self.running_downloads.append(download_thread)
+			self.job_journal.set_state(download_thread.job_id, JobJournal.RUNNING)
+			metrics.observe('oni_queue_wait_seconds', time.monotonic() - download_thread.queued_at, queue='downloads')
+			self.download_thread = download_thread
+			self.progress_panel.update_job(f"#{download_thread.queue_number}", "Starting")
+			download_thread.start()
 
 
 	@pyqtSlot(str)
 	def update_progress_text(self, message):
-		if "Error" in message:
-			self.progress_text.clear()
-		self.progress_text.append(message)
+		self.progress_panel.log(message)
 
 
 	def show_error(self, message):
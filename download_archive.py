@@ -0,0 +1,81 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import closing
+
+
+
+def archive_key(entry, extra_info=None):
+	extra_info = extra_info or {}
+	extractor_key = entry.get('ie_key') or entry.get('extractor_key') or extra_info.get('extractor_key')
+	video_id = entry.get('id')
+	if not extractor_key or not video_id:
+		return None
+	return f'{extractor_key.lower()} {video_id}'
+
+
+def file_checksum(path):
+	checksum = hashlib.sha256()
+	with open(path, 'rb') as file:
+		for chunk in iter(lambda: file.read(1024 * 1024), b''):
+			checksum.update(chunk)
+	return checksum.hexdigest()
+
+
+
+class DownloadArchive:
+	COMPLETE = 'complete'
+	NEW = 'new'
+	MISSING = 'missing'
+	TRUNCATED = 'truncated'
+	CORRUPT = 'corrupt'
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with self.connect() as connection:
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute(
+				'CREATE TABLE IF NOT EXISTS archive ('
+				'video TEXT NOT NULL, preset TEXT NOT NULL, output_path TEXT NOT NULL, '
+				'size INTEGER NOT NULL, checksum TEXT NOT NULL, completed REAL NOT NULL, '
+				'PRIMARY KEY (video, preset))')
+
+
+	def connect(self):
+		return closing(sqlite3.connect(self.path, timeout=30))
+
+
+	def status(self, video, preset, verify_checksum=False):
+		with self.lock, self.connect() as connection:
+			row = connection.execute(
+				'SELECT output_path, size, checksum FROM archive WHERE video = ? AND preset = ?', (video, preset)).fetchone()
+		if row is None:
+			return self.NEW, None
+
+		output_path, size, checksum = row
+		if not os.path.exists(output_path):
+			return self.MISSING, output_path
+		# A size check is enough to catch interrupted writes, hashing is only done on request
+		if os.path.getsize(output_path) != size:
+			return self.TRUNCATED, output_path
+		if verify_checksum and file_checksum(output_path) != checksum:
+			return self.CORRUPT, output_path
+		return self.COMPLETE, output_path
+
+
+	def record(self, video, preset, output_path):
+		size = os.path.getsize(output_path)
+		checksum = file_checksum(output_path)
+		with self.lock, self.connect() as connection, connection:
+			connection.execute(
+				'INSERT OR REPLACE INTO archive (video, preset, output_path, size, checksum, completed) VALUES (?, ?, ?, ?, ?, ?)',
+				(video, preset, output_path, size, checksum, time.time()))
+
+
+""" The class end here """
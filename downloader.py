@@ -0,0 +1,381 @@
+import os
+import shlex
+import time
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from cancellation import CancellationToken, JobCancelled
+from conversion_cache import open_conversion_cache
+from converter import BatchConverter
+from presets import preset_ffmpeg_args
+from metadata_cache import MetadataCache
+from download_archive import DownloadArchive, archive_key
+from metrics import metrics
+from fragment_tuner import FragmentTuner
+from loudness import open_loudness_normalizer
+from retry import ItemOutcomes, call_with_retries
+
+
+
+def parse_rate_limit(rate_limit):
+	if not rate_limit:
+		return None
+
+	from yt_dlp.utils import parse_bytes
+	bytes_per_second = parse_bytes(str(rate_limit).strip())
+	if not bytes_per_second:
+		raise ValueError(f"Invalid rate limit {rate_limit!r}, use bytes per second like 500K or 4.2M")
+	return bytes_per_second
+
+
+def build_ydl_opts(destination, download_format, playlist, performance_options=None):
+	performance_options = performance_options or {}
+	ydl_opts = {
+		'format': download_format,
+		'outtmpl': os.path.join(destination, '%(title)s.%(ext)s'),
+		'noplaylist': not playlist,
+		# Keep .part files and continue them, so a resumed job does not fetch the finished bytes again
+		'continuedl': True,
+		'nopart': False,
+		# HLS and DASH fragments are fetched over this many connections instead of one after another
+		'concurrent_fragment_downloads': performance_options.get("concurrent_fragments") or 1,
+		'ratelimit': parse_rate_limit(performance_options.get("download_rate_limit")),
+	}
+	if performance_options.get("http_chunk_size_mb"):
+		# Some hosts throttle long responses, ranged requests of this size avoid it
+		ydl_opts['http_chunk_size'] = int(performance_options["http_chunk_size_mb"] * 1024 * 1024)
+	if performance_options.get("download_buffer_kb"):
+		ydl_opts['buffersize'] = int(performance_options["download_buffer_kb"] * 1024)
+	if performance_options.get("external_downloader"):
+		ydl_opts['external_downloader'] = {'default': performance_options["external_downloader"]}
+		ydl_opts['external_downloader_args'] = {'default': shlex.split(performance_options.get("external_downloader_args") or '')}
+	return ydl_opts
+
+
+def url_host(url):
+	host = (urlparse(url).hostname or url).lower()
+	return host[4:] if host.startswith('www.') else host
+
+
+def open_metadata_cache(performance_options):
+	return MetadataCache(
+		os.path.join(os.getcwd(), "cache", "metadata.sqlite3"),
+		performance_options.get("metadata_cache_ttl", 3600),
+		performance_options.get("metadata_cache_max_mb", 64) * 1024 * 1024)
+
+
+@lru_cache(maxsize=None)
+def shared_fragment_tuner(max_fragments, probe_seconds):
+	return FragmentTuner(max_fragments, probe_seconds)
+
+
+def open_fragment_tuner(performance_options):
+	# One tuner per process, so what a job learns about a host carries over to the next jobs
+	return shared_fragment_tuner(performance_options.get("max_concurrent_fragments") or 16, performance_options.get("auto_tune_seconds") or 3)
+
+
+def open_download_archive():
+	return DownloadArchive(os.path.join(os.getcwd(), "cache", "download_archive.sqlite3"))
+
+
+
+class Downloader:
+	def __init__(self, url, ydl_opts, selected_quality_option, destination, format_to_extension, playlist, performance_options=None, metadata_cache=None, refresh_metadata=False, download_archive=None, log=print, cancel_token=None, fragment_tuner=None):
+		self.url = url
+		self.ydl_opts = ydl_opts
+		self.selected_quality_option = selected_quality_option
+		self.destination = destination
+		self.format_to_extension = format_to_extension
+		self.playlist = playlist
+		self.performance_options = performance_options or {}
+		self.metadata_cache = metadata_cache
+		self.refresh_metadata = refresh_metadata
+		self.download_archive = download_archive
+		self.log = log
+		self.cancel_token = cancel_token or CancellationToken()
+		self.fragment_tuner = fragment_tuner if self.performance_options.get("auto_tune_fragments") else None
+		self.conversion_cache = open_conversion_cache(self.performance_options)
+		self.loudness = open_loudness_normalizer(self.performance_options)
+		self.outcomes = ItemOutcomes()
+
+
+	def run(self):
+		start_time = time.monotonic()
+		status = 'failed'
+		try:
+			if self.playlist:
+				self.download_playlist()
+			else:
+				self.download_video()
+			status = 'finished'
+		except JobCancelled:
+			status = 'cancelled'
+			raise
+		finally:
+			metrics.event('download_job', url=self.url, playlist=self.playlist, status=status, seconds=round(time.monotonic() - start_time, 3))
+
+
+	def download_video(self):
+		# Imported on first use, yt_dlp loads hundreds of modules and the GUI imports this one before its window shows
+		import yt_dlp as youtube_dl
+
+		selected_quality_option = self.selected_quality_option
+		throughput_probe = self.throughput_probe(self.ydl_opts, self.log)
+		def progress_hook(d):
+			# Raising from the hook is how yt-dlp gets stopped between two chunks, the .part file stays for a resume
+			self.cancel_token.raise_if_cancelled()
+			if throughput_probe:
+				throughput_probe.update(d)
+			if d['status'] == 'downloading':
+				self.log(f"Downloading: {self.format_progress(d)}")
+			elif d['status'] == 'finished':
+				self.record_download(d)
+
+		self.ydl_opts['progress_hooks'] = [progress_hook]
+
+		with youtube_dl.YoutubeDL(self.ydl_opts) as ydl:
+			# Resolve and download in one pass, the returned info knows where the file really ended up
+			info_dict = self.with_retries(self.url, lambda: self.download_resolved(ydl, self.url), self.log)
+			input_media_files = self.downloaded_media_paths(ydl, info_dict)
+
+		self.log("Download completed successfully.")
+		for input_media in input_media_files:
+			self.cancel_token.raise_if_cancelled()
+			self.log("Converting...")
+			self.convert_video(input_media, selected_quality_option)
+			self.log("Successfully converted")
+
+
+	def with_retries(self, item, function, log):
+		# Rate limits and dropped connections get a few more tries, a retried download continues its .part file
+		return call_with_retries(function, self.performance_options, self.cancel_token, log, lambda: self.outcomes.retried(item))
+
+
+	def throughput_probe(self, ydl_opts, log):
+		if not self.fragment_tuner:
+			return None
+
+		# yt-dlp fixes the fragment concurrency when a download starts, so what this one measures tunes the next one from the host
+		throughput_probe = self.fragment_tuner.probe(url_host(self.url), ydl_opts.get('concurrent_fragment_downloads') or 1, log)
+		ydl_opts['concurrent_fragment_downloads'] = throughput_probe.fragments
+		return throughput_probe
+
+
+	def downloaded_media_paths(self, ydl, info_dict):
+		if info_dict.get('_type') == 'playlist':
+			return [input_media for entry in info_dict.get('entries') or [] if entry for input_media in self.downloaded_media_paths(ydl, entry)]
+
+		requested_downloads = info_dict.get('requested_downloads') or [{}]
+		return [requested_downloads[0].get('filepath') or ydl.prepare_filename(info_dict)]
+
+
+	def resolve_info(self, ydl, url, ie_key=None, refresh=False):
+		if self.metadata_cache and (refresh or self.refresh_metadata):
+			# Dropped before resolving, so a stale entry does not outlive a resolve that fails
+			self.metadata_cache.invalidate(url, ydl.params)
+		elif self.metadata_cache:
+			start_time = time.monotonic()
+			info_dict = self.metadata_cache.get(url, ydl.params)
+			if info_dict is not None:
+				self.record_resolve(url, 'cache', time.monotonic() - start_time)
+				self.log(f"Using cached metadata for {url}")
+				return info_dict, True
+
+		start_time = time.monotonic()
+		info_dict = ydl.extract_info(url, ie_key=ie_key, download=False, process=False)
+		self.record_resolve(url, 'extractor', time.monotonic() - start_time)
+		if self.metadata_cache:
+			if info_dict.get('entries') is not None:
+				info_dict['entries'] = list(info_dict['entries'])
+			info_dict = ydl.sanitize_info(info_dict)
+			self.metadata_cache.put(url, info_dict, ydl.params)
+		return info_dict, False
+
+
+	def download_resolved(self, ydl, url, ie_key=None):
+		import yt_dlp as youtube_dl
+
+		info_dict, from_cache = self.resolve_info(ydl, url, ie_key)
+		try:
+			return ydl.process_ie_result(info_dict, download=True)
+		except youtube_dl.utils.DownloadError:
+			if not from_cache:
+				raise
+
+			# Media URLs stored in the cache can expire before the entry itself does
+			self.log(f"Cached metadata for {url} is stale, resolving it again...")
+			metrics.increment('oni_retries_total', stage='stale_metadata')
+			metrics.event('retry', stage='stale_metadata', url=url)
+			info_dict, _ = self.resolve_info(ydl, url, ie_key, refresh=True)
+			return ydl.process_ie_result(info_dict, download=True)
+
+
+	def record_resolve(self, url, source, seconds):
+		metrics.observe('oni_metadata_resolve_seconds', seconds, source=source)
+		metrics.event('metadata', url=url, source=source, seconds=round(seconds, 3))
+
+
+	def record_download(self, d):
+		downloaded_bytes = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+		seconds = d.get('elapsed') or 0
+		metrics.increment('oni_download_bytes_total', downloaded_bytes)
+		metrics.observe('oni_download_seconds', seconds)
+		metrics.event(
+			'download', file=d.get('filename'), bytes=downloaded_bytes, seconds=round(seconds, 3),
+			bytes_per_second=round(downloaded_bytes / seconds) if seconds > 0 else None)
+
+
+	def format_progress(self, d):
+		percent = d['_percent_str'].replace('\x1b[0;94m', '').replace('\x1b[0m', '')
+		speed = d['_speed_str'].replace('\x1b[0;32m', '').replace('\x1b[0m', '')
+		eta = d['_eta_str'].replace('\x1b[0;33m', '').replace('\x1b[0m', '')
+		return f"{percent} ({speed}, ETA: {eta})"
+
+
+	def download_playlist(self):
+		import yt_dlp as youtube_dl
+
+		selected_quality_option = self.selected_quality_option
+		self.log("Fetching a playlist data...")
+		with youtube_dl.YoutubeDL(self.ydl_opts) as ydl:
+			# Only enumerate the entries here, each one is resolved again by the download stage
+			playlist_info, _ = self.with_retries(self.url, lambda: self.resolve_info(ydl, self.url), self.log)
+
+		entries = [entry for entry in playlist_info.get('entries') or [playlist_info] if entry]
+		extra_info = {key: value for key, value in playlist_info.items() if key.startswith(('extractor', 'webpage_url'))}
+		total_entries = len(entries)
+		download_workers = self.performance_options.get("playlist_download_workers") or 1
+		conversion_workers = self.performance_options.get("playlist_conversion_workers") or os.cpu_count() or 1
+		self.log(
+			f"Processing {total_entries} playlist entries with {download_workers} downloads and {conversion_workers} conversions at a time...")
+
+		preset = f'{selected_quality_option["format"]}/{selected_quality_option["name"]}'
+		queued_entries = []
+		skipped_entries = 0
+		for index, entry in enumerate(entries, start=1):
+			video = archive_key(entry, extra_info)
+			if self.download_archive and video:
+				status, output_media = self.download_archive.status(video, preset, self.performance_options.get("archive_verify_checksums", False))
+				if status == DownloadArchive.COMPLETE:
+					skipped_entries += 1
+					continue
+				if status != DownloadArchive.NEW:
+					self.log(f"[{index}/{total_entries}] Output {output_media} is {status}, downloading it again...")
+			queued_entries.append((index, entry, video))
+
+		if self.download_archive:
+			self.log(f"Sync: {skipped_entries} entries already in the download archive, {len(queued_entries)} to download.")
+
+		entry_names = {index: entry.get('title') or entry.get('url') or f"entry {index}" for index, entry, _ in queued_entries}
+		converted_entries = 0
+		# Downloads and conversions run in separate pools so entry N+1 downloads while entry N converts
+		with ThreadPoolExecutor(max_workers=download_workers) as download_executor, ThreadPoolExecutor(max_workers=conversion_workers) as conversion_executor:
+			download_futures = {
+				download_executor.submit(self.download_playlist_entry, entry, index, total_entries, extra_info, entry_names[index]): (index, video)
+				for index, entry, video in queued_entries
+			}
+			conversion_futures = {}
+			pending = set(download_futures)
+
+			while pending:
+				done, pending = wait(pending, return_when=FIRST_COMPLETED)
+				for future in done:
+					if future in download_futures:
+						index, video = download_futures[future]
+						try:
+							input_media, info_dict = future.result()
+						except JobCancelled:
+							self.outcomes.record(entry_names[index], ItemOutcomes.CANCELLED)
+							continue
+						except Exception as e:
+							self.outcomes.record(entry_names[index], ItemOutcomes.FAILED, f"download: {str(e)}")
+							self.log(f"[{index}/{total_entries}] Error downloading: {str(e)}")
+							continue
+
+						video_title = info_dict.get('title', 'video')
+						self.log(f"[{index}/{total_entries}] Download completed for {video_title}, converting...")
+						conversion_future = conversion_executor.submit(
+							self.convert_playlist_entry, input_media, selected_quality_option, video or archive_key(info_dict), preset)
+						conversion_futures[conversion_future] = (index, video_title)
+						pending.add(conversion_future)
+					else:
+						index, video_title = conversion_futures[future]
+						try:
+							future.result()
+						except JobCancelled:
+							self.outcomes.record(entry_names[index], ItemOutcomes.CANCELLED)
+							continue
+						except Exception as e:
+							self.outcomes.record(entry_names[index], ItemOutcomes.FAILED, f"conversion: {str(e)}")
+							self.log(f"[{index}/{total_entries}] Error converting {video_title}: {str(e)}")
+							continue
+
+						converted_entries += 1
+						self.outcomes.record(entry_names[index], ItemOutcomes.SUCCEEDED)
+						self.log(f"[{index}/{total_entries}] Successfully converted {video_title}")
+
+		self.cancel_token.raise_if_cancelled()
+		self.log(f"Playlist finished: {converted_entries}/{len(queued_entries)} entries converted.")
+		self.log(self.outcomes.summary())
+
+
+	def download_playlist_entry(self, entry, index, total_entries, extra_info, entry_name):
+		import yt_dlp as youtube_dl
+
+		self.cancel_token.raise_if_cancelled()
+		# YoutubeDL instances are not thread safe, so every concurrent download gets its own
+		ydl_opts = dict(self.ydl_opts)
+		throughput_probe = self.throughput_probe(ydl_opts, lambda message: self.log(f"[{index}/{total_entries}] {message}"))
+		def progress_hook(d):
+			self.cancel_token.raise_if_cancelled()
+			if throughput_probe:
+				throughput_probe.update(d)
+			if d['status'] == 'downloading':
+				self.log(f"[{index}/{total_entries}] Downloading: {self.format_progress(d)}")
+			elif d['status'] == 'finished':
+				self.record_download(d)
+
+		ydl_opts['progress_hooks'] = [progress_hook]
+		with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+			# Flat url entries get resolved here, entries that are already full results are just downloaded
+			if entry.get('_type') == 'url':
+				download = lambda: self.download_resolved(ydl, entry['url'], entry.get('ie_key'))
+			else:
+				download = lambda: ydl.process_ie_result(dict(entry), download=True, extra_info=extra_info)
+			info_dict = self.with_retries(entry_name, download, lambda message: self.log(f"[{index}/{total_entries}] {message}"))
+			input_media = self.downloaded_media_paths(ydl, info_dict)[0]
+
+		return input_media, info_dict
+
+
+	def convert_playlist_entry(self, input_media, selected_quality_option, video, preset):
+		output_media = self.convert_video(input_media, selected_quality_option)
+		if self.download_archive and video:
+			self.download_archive.record(video, preset, output_media)
+
+
+	def convert_video(self, input_media, selected_quality_option):
+		video_title = os.path.splitext(os.path.basename(input_media))[0]
+		output_media = self.output_media_path(video_title, selected_quality_option)
+		# Converted like in the conversion tab, with its conversion cache and loudness passes
+		batch_converter = BatchConverter(
+			[input_media], preset_ffmpeg_args(selected_quality_option), [output_media], 1,
+			self.performance_options.get("progress_interval", 1.0), self.log, self.cancel_token,
+			conversion_cache=self.conversion_cache, loudness=self.loudness)
+		decisions = batch_converter.convert_media(input_media, [output_media])
+		self.log(f"Converted {video_title} by {decisions[0]}")
+		try:
+			os.remove(input_media)
+		except OSError as e:
+			self.log(f"Error removing input media: {str(e)}")
+		return output_media
+
+
+	def output_media_path(self, video_title, selected_quality_option):
+		output_extension = self.format_to_extension.get(selected_quality_option["format"], 'mp4')
+		return os.path.join(self.destination, f'{video_title}.{selected_quality_option["name"]}.{output_extension}')
+
+
+""" The class end here """
@@ -0,0 +1,199 @@
+import re
+import subprocess
+import threading
+import time
+
+from collections import deque
+from functools import lru_cache
+
+from cancellation import JobCancelled
+from metrics import metrics
+
+
+
+# Keep ffmpeg from flashing a console window in the windowed build, without going through the shell
+NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+STDERR_TAIL_LINES = 50
+
+# How long a cancelled ffmpeg gets to exit on its own before it is killed
+STOP_TIMEOUT = 2
+
+DURATION_PATTERN = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+SAMPLE_RATE_PATTERN = re.compile(r'Stream #.*: Audio: .*?, (\d+) Hz')
+LOG_CONTEXT_PATTERN = re.compile(r'^\[[^\]]+ @ 0x[0-9a-f]+\] ')
+
+
+@lru_cache(maxsize=None)
+def ffmpeg_version():
+	try:
+		result = subprocess.run(
+			['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+			text=True, errors='replace', creationflags=NO_WINDOW)
+		return result.stdout.splitlines()[0]
+	except (OSError, IndexError):
+		return 'unknown'
+
+
+def parse_duration(text):
+	match = DURATION_PATTERN.search(text)
+	if not match:
+		return None
+	hours, minutes, seconds = match.groups()
+	return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def ffmpeg_error_reason(stderr_tail):
+	# The last line is often just "Conversion failed!", the cause is logged right before it
+	for line in reversed(stderr_tail):
+		line = LOG_CONTEXT_PATTERN.sub('', line.strip())
+		if line and line != 'Conversion failed!':
+			return line
+	return None
+
+
+def format_eta(seconds):
+	minutes, seconds = divmod(int(seconds), 60)
+	hours, minutes = divmod(minutes, 60)
+	return f"{hours:d}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def format_ffmpeg_progress(name, progress):
+	percent = f"{progress['percent']:.1f}%" if progress['percent'] is not None else f"{progress['out_time']:.0f}s"
+	eta = format_eta(progress['eta']) if progress['eta'] is not None else "Unknown"
+	return f"Converting {name}: {percent} ({progress['fps']:.1f} fps, {progress['speed']:.2f}x, ETA: {eta})"
+
+
+
+class FfmpegError(RuntimeError):
+	def __init__(self, returncode, stderr_tail=()):
+		self.returncode = returncode
+		self.stderr_tail = list(stderr_tail)
+		reason = ffmpeg_error_reason(self.stderr_tail)
+		super().__init__(f"ffmpeg exited with code {returncode}: {reason}" if reason else f"ffmpeg exited with code {returncode}")
+
+
+""" The class end here """
+
+
+
+class FfmpegProcess:
+	def __init__(self, ffmpeg_command, progress_callback=None, progress_interval=1.0, cancel_token=None):
+		self.ffmpeg_command = [ffmpeg_command[0], '-progress', 'pipe:1', '-nostats', *ffmpeg_command[1:]]
+		self.progress_callback = progress_callback
+		self.progress_interval = progress_interval
+		self.cancel_token = cancel_token
+		self.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+		self.duration = None
+		self.sample_rate = None
+		self.returncode = None
+		self.last_progress = {}
+
+
+	def run(self):
+		start_time = time.monotonic()
+		process = subprocess.Popen(
+			self.ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+			text=True, encoding='utf-8', errors='replace', creationflags=NO_WINDOW)
+
+		# stderr is drained on its own thread so neither pipe can fill up and block ffmpeg
+		stderr_thread = threading.Thread(target=self.read_stderr, args=(process.stderr,), daemon=True)
+		stderr_thread.start()
+
+		unregister = self.cancel_token.register(lambda: self.stop(process)) if self.cancel_token else lambda: None
+		try:
+			progress = {}
+			last_report = 0
+			for line in process.stdout:
+				key, _, value = line.strip().partition('=')
+				progress[key] = value
+				if key != 'progress':
+					continue
+
+				self.last_progress = progress
+				now = time.monotonic()
+				if value == 'end' or now - last_report >= self.progress_interval:
+					last_report = now
+					self.report_progress(progress)
+				progress = {}
+
+			self.returncode = process.wait()
+		except BaseException:
+			# Never leave ffmpeg running behind a failed progress callback or an interrupt
+			process.kill()
+			process.wait()
+			raise
+		finally:
+			unregister()
+			stderr_thread.join()
+
+		cancelled = bool(self.cancel_token and self.cancel_token.cancelled)
+		self.record_metrics(time.monotonic() - start_time, cancelled)
+		if cancelled:
+			raise JobCancelled("Conversion cancelled")
+		return self.returncode
+
+
+	def record_metrics(self, seconds, cancelled):
+		try:
+			frames = int(self.last_progress.get('frame', 0))
+		except ValueError:
+			frames = 0
+		metrics.observe('oni_ffmpeg_seconds', seconds)
+		metrics.increment('oni_ffmpeg_frames_total', frames)
+		metrics.increment('oni_ffmpeg_exits_total', code='cancelled' if cancelled else str(self.returncode))
+		metrics.event(
+			'ffmpeg', output=self.ffmpeg_command[-1], seconds=round(seconds, 3), returncode=self.returncode, cancelled=cancelled,
+			frames=frames, fps=round(frames / seconds, 2) if seconds > 0 else 0.0, speed=self.last_progress.get('speed', '').strip() or None, duration=self.duration)
+
+
+	def stop(self, process):
+		# ffmpeg flushes its encoders on SIGTERM, which takes long with slow presets, and the partial output is thrown away anyway
+		process.terminate()
+		kill_timer = threading.Timer(STOP_TIMEOUT, lambda: process.poll() is None and process.kill())
+		kill_timer.daemon = True
+		kill_timer.start()
+
+
+	def read_stderr(self, stderr):
+		for line in stderr:
+			if self.duration is None:
+				self.duration = parse_duration(line)
+			# The input streams come first in the banner, the output ones and the log can push them out of the tail
+			if self.sample_rate is None:
+				sample_rate = SAMPLE_RATE_PATTERN.search(line)
+				self.sample_rate = int(sample_rate.group(1)) if sample_rate else None
+			self.stderr_tail.append(line.rstrip())
+
+
+	def report_progress(self, progress):
+		if not self.progress_callback:
+			return
+
+		try:
+			out_time = int(progress.get('out_time_us', 0)) / 1000000
+		except ValueError:
+			out_time = 0.0
+		try:
+			frame = int(progress.get('frame', 0))
+		except ValueError:
+			frame = 0
+		try:
+			fps = float(progress.get('fps', 0))
+		except ValueError:
+			fps = 0.0
+		try:
+			speed = float(progress.get('speed', '0').rstrip('x'))
+		except ValueError:
+			speed = 0.0
+
+		percent = eta = None
+		if self.duration:
+			percent = min(out_time / self.duration * 100, 100.0)
+			if speed > 0:
+				eta = max(self.duration - out_time, 0) / speed
+
+		self.progress_callback({'percent': percent, 'out_time': out_time, 'frame': frame, 'fps': fps, 'speed': speed, 'eta': eta})
+
+
+""" The class end here """
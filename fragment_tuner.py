@@ -0,0 +1,84 @@
+import threading
+import time
+
+
+
+class ThroughputProbe:
+	def __init__(self, tuner, host, fragments, log=print):
+		self.tuner = tuner
+		self.host = host
+		self.fragments = fragments
+		self.log = log
+		self.started_at = None
+		self.start_bytes = 0
+		self.done = False
+
+
+	def update(self, d):
+		if self.done or d.get('status') != 'downloading':
+			return
+		if d.get('fragment_count') is None:
+			# Plain HTTP downloads use one connection whatever the fragment setting is
+			self.done = True
+			return
+
+		downloaded_bytes = d.get('downloaded_bytes') or 0
+		if self.started_at is None:
+			# Bytes of a continued .part file were not fetched now, so measure from the first report on
+			self.started_at = time.monotonic()
+			self.start_bytes = downloaded_bytes
+			return
+
+		seconds = time.monotonic() - self.started_at
+		if seconds >= self.tuner.probe_seconds:
+			self.done = True
+			bytes_per_second = (downloaded_bytes - self.start_bytes) / seconds
+			next_fragments = self.tuner.record(self.host, self.fragments, bytes_per_second)
+			if next_fragments != self.fragments:
+				self.log(
+					f"Auto-tune: {self.host} did {bytes_per_second / (1024 * 1024):.1f} MB/s with {self.fragments} fragments, using {next_fragments} next")
+
+
+""" The class end here """
+
+
+
+class FragmentTuner:
+	# A new concurrency has to beat the best one by this much, otherwise the search stops
+	MIN_GAIN = 1.1
+
+	def __init__(self, max_fragments=16, probe_seconds=3):
+		self.max_fragments = max(max_fragments, 1)
+		self.probe_seconds = probe_seconds
+		self.hosts = {}
+		self.lock = threading.Lock()
+
+
+	def fragments(self, host, initial_fragments):
+		with self.lock:
+			return self.hosts.get(host, {}).get('fragments', min(max(initial_fragments, 1), self.max_fragments))
+
+
+	def probe(self, host, initial_fragments, log=print):
+		return ThroughputProbe(self, host, self.fragments(host, initial_fragments), log)
+
+
+	def record(self, host, fragments, bytes_per_second):
+		with self.lock:
+			state = self.hosts.setdefault(host, {'fragments': fragments, 'best_fragments': fragments, 'best_rate': 0, 'settled': False})
+			if state['settled'] or fragments != state['fragments']:
+				return state['fragments']
+
+			if bytes_per_second > state['best_rate'] * self.MIN_GAIN:
+				# Still scaling, try twice the connections on the next download from this host
+				state['best_fragments'] = fragments
+				state['best_rate'] = bytes_per_second
+				state['fragments'] = min(fragments * 2, self.max_fragments)
+				state['settled'] = state['fragments'] == fragments
+			else:
+				state['fragments'] = state['best_fragments']
+				state['settled'] = True
+			return state['fragments']
+
+
+""" The class end here """
@@ -0,0 +1,286 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from cancellation import CancellationToken
+from converter import BatchConverter, conversion_output_path
+from hot_folder_index import HotFolderIndex, open_hot_folder_index
+from loudness import open_loudness_normalizer
+from presets import preset_ffmpeg_args
+from retry import ItemOutcomes
+
+
+
+MEDIA_EXTENSIONS = ('.aac', '.avi', '.flac', '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.ogg', '.opus', '.wav', '.webm', '.wma', '.wmv')
+
+# Folder times on FAT and SMB shares are this coarse, a scan this close to a change may have missed a file
+MTIME_GRANULARITY_NS = 2 * 10 ** 9
+
+
+
+class InotifyWatcher:
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+	IN_Q_OVERFLOW = 0x00004000
+	EVENT_HEADER = struct.Struct('iIII')
+
+	def __init__(self, folder):
+		libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		if libc.inotify_add_watch(self.fd, os.fsencode(folder), self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE) < 0:
+			errno = ctypes.get_errno()
+			os.close(self.fd)
+			raise OSError(errno, f"Cannot watch {folder}")
+
+
+	def read(self, timeout):
+		"""Return the names created, written or moved into the folder, and whether the kernel dropped events."""
+		readable, _, _ = select.select([self.fd], [], [], timeout)
+		if not readable:
+			return [], False
+		try:
+			data = os.read(self.fd, 64 * 1024)
+		except BlockingIOError:
+			return [], False
+
+		names = []
+		overflow = False
+		offset = 0
+		while offset + self.EVENT_HEADER.size <= len(data):
+			_, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+			offset += self.EVENT_HEADER.size
+			name = data[offset:offset + length].rstrip(b'\0')
+			offset += length
+			if mask & self.IN_Q_OVERFLOW:
+				overflow = True
+			elif name:
+				names.append(os.fsdecode(name))
+		return names, overflow
+
+
+	def close(self):
+		os.close(self.fd)
+
+
+""" The class end here """
+
+
+
+def open_folder_watcher(folder):
+	# Anything without inotify falls back to scanning the folder every poll interval
+	if not sys.platform.startswith('linux'):
+		return None
+	try:
+		return InotifyWatcher(folder)
+	except (OSError, AttributeError):
+		return None
+
+
+
+class HotFolder:
+	def __init__(self, folder, destination, quality_options, format_to_extension, performance_options=None, log=print, cancel_token=None, conversion_cache=None, index=None, workers=None, segments=0):
+		self.folder = os.path.abspath(folder)
+		self.destination = os.path.abspath(destination)
+		if self.destination == self.folder:
+			raise ValueError("The destination must not be the watched folder, the outputs would be converted again")
+
+		self.quality_options = quality_options
+		self.format_to_extension = format_to_extension
+		self.performance_options = performance_options or {}
+		self.log = log
+		self.cancel_token = cancel_token or CancellationToken()
+		self.conversion_cache = conversion_cache
+		self.index = index or open_hot_folder_index()
+		self.workers = workers
+		self.segments = segments
+		self.loudness = open_loudness_normalizer(self.performance_options)
+		self.stable_seconds = self.performance_options.get("hot_folder_stable_seconds", 10)
+		self.poll_interval = self.performance_options.get("hot_folder_poll_interval", 5)
+		self.batch_size = self.performance_options.get("hot_folder_batch_size") or 32
+		self.move_processed = self.performance_options.get("hot_folder_processed", "move") == "move"
+		self.extensions = tuple(extension.lower() for extension in self.performance_options.get("hot_folder_extensions") or MEDIA_EXTENSIONS)
+		# Handled files by name with the size and time they had, and the ones still waiting to be stable
+		self.known = {}
+		self.candidates = {}
+		self.folder_mtime_ns = None
+		self.last_scan = 0
+		self.converted_files = 0
+
+
+	def run(self):
+		os.makedirs(self.destination, exist_ok=True)
+		for name, (state, size, mtime_ns) in self.index.files(self.folder).items():
+			if state == HotFolderIndex.PENDING:
+				self.candidates[name] = None
+			else:
+				self.known[name] = (size, mtime_ns)
+		self.folder_mtime_ns = self.index.folder_mtime(self.folder)
+
+		watcher = open_folder_watcher(self.folder)
+		self.log(
+			f"Watching {self.folder} ({'inotify' if watcher else f'polling every {self.poll_interval} seconds'}): "
+			f"{len(self.known)} files handled before, {len(self.candidates)} waiting from the last run")
+		try:
+			while not self.cancel_token.cancelled:
+				# Scanned with inotify too, it never sees files another machine writes to a network share
+				if time.monotonic() - self.last_scan >= self.poll_interval:
+					self.scan()
+
+				ready = self.stable_files()
+				if ready:
+					self.convert(ready[:self.batch_size])
+				elif watcher:
+					names, overflow = watcher.read(1.0)
+					if overflow:
+						self.folder_mtime_ns = None
+						self.last_scan = 0
+					self.add_changed(names)
+				else:
+					self.cancel_token.wait(1.0)
+		finally:
+			if watcher:
+				watcher.close()
+
+		self.log(f"Stopped watching {self.folder}, {self.converted_files} files converted")
+		return self.converted_files
+
+
+	def accepts(self, name):
+		return not name.startswith('.') and '.part.' not in name and os.path.splitext(name)[1].lower() in self.extensions
+
+
+	def scan(self):
+		self.last_scan = time.monotonic()
+		mtime_ns = os.stat(self.folder).st_mtime_ns
+		# Adding or removing a file changes the folder's time, an unchanged folder is not listed again
+		if mtime_ns == self.folder_mtime_ns:
+			return
+
+		with os.scandir(self.folder) as entries:
+			new_names = [
+				entry.name for entry in entries
+				if entry.name not in self.known and entry.name not in self.candidates and self.accepts(entry.name) and entry.is_file()
+			]
+		self.add_candidates(new_names)
+		if time.time_ns() - mtime_ns > MTIME_GRANULARITY_NS:
+			self.folder_mtime_ns = mtime_ns
+			self.index.set_folder_mtime(self.folder, mtime_ns)
+
+
+	def add_changed(self, names):
+		new_names = []
+		for name in dict.fromkeys(names):
+			if name in self.candidates or not self.accepts(name):
+				continue
+			if name in self.known:
+				# Scans skip handled names, but a file written again under the same name is a new input
+				try:
+					stat = os.stat(os.path.join(self.folder, name))
+				except OSError:
+					continue
+				if (stat.st_size, stat.st_mtime_ns) == self.known[name]:
+					continue
+				del self.known[name]
+			new_names.append(name)
+		self.add_candidates(new_names)
+
+
+	def add_candidates(self, names):
+		if not names:
+			return
+		for name in names:
+			self.candidates[name] = None
+		# Recorded as pending, so a restart picks them up without listing the folder again
+		self.index.set_state(self.folder, [(name, 0, 0) for name in names], HotFolderIndex.PENDING)
+		self.log(f"Found {len(names)} new files, waiting until they stop growing")
+
+
+	def stable_files(self):
+		now = time.monotonic()
+		ready = []
+		vanished = []
+		for name, seen in list(self.candidates.items()):
+			try:
+				stat = os.stat(os.path.join(self.folder, name))
+			except FileNotFoundError:
+				vanished.append(name)
+				continue
+
+			signature = (stat.st_size, stat.st_mtime_ns)
+			if seen is None or seen[0] != signature:
+				self.candidates[name] = (signature, now)
+			elif now - seen[1] >= self.stable_seconds:
+				ready.append(name)
+
+		if vanished:
+			for name in vanished:
+				del self.candidates[name]
+			self.index.remove(self.folder, vanished)
+		return ready
+
+
+	def convert(self, names):
+		input_media_files = [os.path.join(self.folder, name) for name in names]
+		output_media_files = [
+			[
+				conversion_output_path(self.destination, media, quality_option["name"], self.format_to_extension.get(quality_option["format"], 'mp4'))
+				for quality_option in self.quality_options
+			]
+			for media in input_media_files
+		]
+		batch_converter = BatchConverter(
+			input_media_files, [preset_ffmpeg_args(quality_option) for quality_option in self.quality_options], output_media_files,
+			self.workers or self.performance_options.get("conversion_workers"), self.performance_options.get("progress_interval", 1.0),
+			self.log, self.cancel_token, self.segments, self.performance_options.get("segment_min_duration", 600), self.conversion_cache,
+			self.loudness)
+		batch_converter.run()
+
+		# Cancelled inputs stay pending and convert again on the next start
+		processed = [name for name, media in zip(names, input_media_files) if batch_converter.outcomes.status(media) == ItemOutcomes.SUCCEEDED]
+		failed = [name for name, media in zip(names, input_media_files) if batch_converter.outcomes.status(media) == ItemOutcomes.FAILED]
+		self.finish(processed, HotFolderIndex.PROCESSED, "processed")
+		self.finish(failed, HotFolderIndex.FAILED, "failed")
+		self.converted_files += len(processed)
+
+
+	def finish(self, names, state, subfolder):
+		if not names:
+			return
+
+		marked = []
+		moved = []
+		for name in names:
+			signature, _ = self.candidates.pop(name)
+			if self.move_processed:
+				try:
+					self.move_input(name, subfolder)
+					moved.append(name)
+					continue
+				except OSError as e:
+					self.log(f"Could not move {name} to {subfolder}: {str(e)}")
+			self.known[name] = signature
+			marked.append((name, *signature))
+
+		# Moved inputs free their name, a later file with the same name is converted as a new one
+		self.index.remove(self.folder, moved)
+		self.index.set_state(self.folder, marked, state)
+
+
+	def move_input(self, name, subfolder):
+		target_folder = os.path.join(self.folder, subfolder)
+		os.makedirs(target_folder, exist_ok=True)
+		base, extension = os.path.splitext(name)
+		target = os.path.join(target_folder, name)
+		if os.path.exists(target):
+			target = os.path.join(target_folder, f"{base}.{time.strftime('%Y%m%d-%H%M%S')}{extension}")
+		os.replace(os.path.join(self.folder, name), target)
+
+
+""" The class end here """
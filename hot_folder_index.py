@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import closing
+
+
+
+def open_hot_folder_index():
+	return HotFolderIndex(os.path.join(os.getcwd(), "cache", "hot_folder.sqlite3"))
+
+
+
+class HotFolderIndex:
+	PENDING = 'pending'
+	PROCESSED = 'processed'
+	FAILED = 'failed'
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with self.connect() as connection:
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute(
+				'CREATE TABLE IF NOT EXISTS files ('
+				'folder TEXT NOT NULL, name TEXT NOT NULL, state TEXT NOT NULL, size INTEGER NOT NULL, '
+				'mtime_ns INTEGER NOT NULL, updated REAL NOT NULL, PRIMARY KEY (folder, name))')
+			connection.execute('CREATE TABLE IF NOT EXISTS folders (folder TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL)')
+
+
+	def connect(self):
+		return closing(sqlite3.connect(self.path, timeout=30))
+
+
+	def files(self, folder):
+		with self.lock, self.connect() as connection:
+			rows = connection.execute('SELECT name, state, size, mtime_ns FROM files WHERE folder = ?', (folder,)).fetchall()
+		return {name: (state, size, mtime_ns) for name, state, size, mtime_ns in rows}
+
+
+	def set_state(self, folder, files, state):
+		# files holds (name, size, mtime_ns) tuples, one transaction for a whole batch
+		now = time.time()
+		with self.lock, self.connect() as connection, connection:
+			connection.executemany(
+				'INSERT INTO files (folder, name, state, size, mtime_ns, updated) VALUES (?, ?, ?, ?, ?, ?) '
+				'ON CONFLICT (folder, name) DO UPDATE SET state = excluded.state, size = excluded.size, '
+				'mtime_ns = excluded.mtime_ns, updated = excluded.updated',
+				[(folder, name, state, size, mtime_ns, now) for name, size, mtime_ns in files])
+
+
+	def remove(self, folder, names):
+		with self.lock, self.connect() as connection, connection:
+			connection.executemany('DELETE FROM files WHERE folder = ? AND name = ?', [(folder, name) for name in names])
+
+
+	def folder_mtime(self, folder):
+		with self.lock, self.connect() as connection:
+			row = connection.execute('SELECT mtime_ns FROM folders WHERE folder = ?', (folder,)).fetchone()
+		return row[0] if row else None
+
+
+	def set_folder_mtime(self, folder, mtime_ns):
+		with self.lock, self.connect() as connection, connection:
+			connection.execute(
+				'INSERT INTO folders (folder, mtime_ns) VALUES (?, ?) ON CONFLICT (folder) DO UPDATE SET mtime_ns = excluded.mtime_ns',
+				(folder, mtime_ns))
+
+
+""" The class end here """
@@ -0,0 +1,85 @@
+import json
+import os
+import secrets
+
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+
+
+class JobServerError(Exception):
+	pass
+
+
+
+def server_token_path():
+	return os.path.join(os.getcwd(), "cache", "job_server.token")
+
+
+def read_server_token():
+	try:
+		with open(server_token_path(), 'r', encoding='utf-8') as file:
+			return file.read().strip()
+	except FileNotFoundError:
+		raise JobServerError(f"No job server token in {server_token_path()}, start the server from this folder with python -m cli serve first")
+
+
+def create_server_token():
+	# Readable by the user running the server only, the GUI and the CLI of the same install read it from there
+	path = server_token_path()
+	if os.path.exists(path):
+		return read_server_token()
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	token = secrets.token_urlsafe(32)
+	with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', encoding='utf-8') as file:
+		file.write(token)
+	return token
+
+
+
+class JobClient:
+	def __init__(self, server_url, timeout=10, token=None):
+		self.server_url = server_url.rstrip('/')
+		self.timeout = timeout
+		self.token = token
+
+
+	def request(self, method, path, payload=None, stream=False):
+		if self.token is None:
+			self.token = read_server_token()
+		data = json.dumps(payload).encode('utf-8') if payload is not None else None
+		request = Request(
+			self.server_url + path, data=data, method=method,
+			headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'})
+		try:
+			return urlopen(request, timeout=None if stream else self.timeout)
+		except HTTPError as e:
+			try:
+				message = json.load(e).get('error', str(e))
+			except ValueError:
+				message = str(e)
+			raise JobServerError(message) from e
+
+
+	def submit(self, spec, priority=0):
+		with self.request('POST', '/jobs', {'spec': spec, 'priority': priority}) as response:
+			return json.load(response)
+
+
+	def cancel(self, job_id):
+		with self.request('DELETE', f'/jobs/{job_id}') as response:
+			return json.load(response)
+
+
+	def events(self, job_id, cancel_token=None):
+		# Jobs can stay quiet for a long time while ffmpeg works, so the stream has no read timeout
+		# The server's keepalive lines give a cancelled listener the chance to stop
+		with self.request('GET', f'/jobs/{job_id}/events', stream=True) as response:
+			for line in response:
+				if cancel_token and cancel_token.cancelled:
+					return
+				if line.strip():
+					yield json.loads(line)
+
+
+""" The class end here """
@@ -0,0 +1,61 @@
+import threading
+
+from PyQt5.QtCore import pyqtSignal, QThread
+from cancellation import CancellationToken
+from job_client import JobClient, JobServerError
+from progress_log import ProgressThrottle
+
+
+
+class RemoteJobThread(QThread):
+	progress_signal = pyqtSignal(str)
+
+	def __init__(self, server_url, spec, priority=0, parent=None):
+		super().__init__(parent)
+		self.client = JobClient(server_url)
+		self.spec = spec
+		self.priority = priority
+		self.job_id = None
+		self.cancel_requested = False
+		self.listen_token = CancellationToken()
+
+
+	def run(self):
+		try:
+			job = self.client.submit(self.spec, self.priority)
+			self.job_id = job['id']
+			self.progress_signal.emit(f"Submitted job {self.job_id} to {self.client.server_url}")
+			# Cancelled while the submit was still on its way, the server only knows the job from here on
+			if self.cancel_requested:
+				self.send_cancel()
+			progress_log = ProgressThrottle(self.progress_signal.emit)
+			for event in self.client.events(self.job_id, self.listen_token):
+				if 'message' in event:
+					progress_log(event['message'])
+				else:
+					progress_log(f"Job {self.job_id} {event['status']}")
+		except (JobServerError, OSError) as e:
+			self.progress_signal.emit(f"Error: Job server: {str(e)}")
+
+
+	def stop(self):
+		# Stops following the job, the job itself keeps running on the server
+		self.listen_token.cancel()
+
+
+	def cancel(self):
+		self.cancel_requested = True
+		if self.job_id is not None:
+			# Sent from a thread of its own, the GUI must not wait for the server to answer
+			threading.Thread(target=self.send_cancel, daemon=True).start()
+
+
+	def send_cancel(self):
+		if self.job_id is not None:
+			try:
+				self.client.cancel(self.job_id)
+			except (JobServerError, OSError):
+				pass
+
+
+""" The class end here """
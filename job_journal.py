@@ -0,0 +1,74 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import closing
+
+
+
+def open_job_journal():
+	return JobJournal(os.path.join(os.getcwd(), "cache", "job_journal.sqlite3"))
+
+
+
+class JobJournal:
+	QUEUED = 'queued'
+	RUNNING = 'running'
+	COMPLETE = 'complete'
+	FAILED = 'failed'
+	CANCELLED = 'cancelled'
+	UNFINISHED = (QUEUED, RUNNING)
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with self.connect() as connection:
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute(
+				'CREATE TABLE IF NOT EXISTS jobs ('
+				'id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, spec TEXT NOT NULL, '
+				'state TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL)')
+
+
+	def connect(self):
+		return closing(sqlite3.connect(self.path, timeout=30))
+
+
+	def add(self, kind, spec):
+		now = time.time()
+		with self.lock, self.connect() as connection, connection:
+			cursor = connection.execute(
+				'INSERT INTO jobs (kind, spec, state, created, updated) VALUES (?, ?, ?, ?, ?)',
+				(kind, json.dumps(spec), self.QUEUED, now, now))
+			return cursor.lastrowid
+
+
+	def set_state(self, job_id, state):
+		with self.lock, self.connect() as connection, connection:
+			connection.execute('UPDATE jobs SET state = ?, updated = ? WHERE id = ?', (state, time.time(), job_id))
+
+
+	def update_spec(self, job_id, spec):
+		with self.lock, self.connect() as connection, connection:
+			connection.execute('UPDATE jobs SET spec = ?, updated = ? WHERE id = ?', (json.dumps(spec), time.time(), job_id))
+
+
+	def unfinished(self, kind):
+		# Jobs still queued or running here were cut off by a crash or by closing the app
+		with self.lock, self.connect() as connection:
+			rows = connection.execute(
+				'SELECT id, spec FROM jobs WHERE kind = ? AND state IN (?, ?) ORDER BY id', (kind, *self.UNFINISHED)).fetchall()
+		return [(job_id, json.loads(spec)) for job_id, spec in rows]
+
+
+	def prune(self, max_age=30 * 24 * 3600):
+		with self.lock, self.connect() as connection, connection:
+			connection.execute(
+				'DELETE FROM jobs WHERE state NOT IN (?, ?) AND updated < ?', (*self.UNFINISHED, time.time() - max_age))
+
+
+""" The class end here """
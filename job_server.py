@@ -0,0 +1,354 @@
+import asyncio
+import hmac
+import itertools
+import json
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from cancellation import CancellationToken, JobCancelled
+from job_client import create_server_token, server_token_path
+from job_journal import JobJournal, open_job_journal
+from jobs import remaining_job, run_job, validate_job
+from metrics import metrics
+from progress_log import ProgressThrottle
+
+
+
+JOB_EVENTS_LIMIT = 1000
+FINAL_STATUSES = ('finished', 'failed', 'cancelled')
+# Event streams send an empty line when idle, so clients notice a closed server and can stop listening
+KEEPALIVE_INTERVAL = 2
+
+LOOPBACK_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+
+class Job:
+	def __init__(self, job_id, spec, priority):
+		self.job_id = job_id
+		self.spec = spec
+		self.priority = priority
+		self.status = 'queued'
+		self.cancel_requested = False
+		self.cancel_token = CancellationToken()
+		# What the journal keeps, the spec as submitted and the URLs of it that already finished
+		self.journal_entry = {'spec': spec, 'priority': priority, 'completed_urls': []}
+		self.returncode = None
+		self.created = time.time()
+		self.started = None
+		self.finished = None
+		# Only the newest events are kept, event_offset counts the ones dropped so streams keep their position
+		self.events = []
+		self.event_offset = 0
+		self.changed = asyncio.Condition()
+
+
+	def add_event(self, message):
+		self.events.append({'time': time.time(), 'message': message})
+		if len(self.events) > JOB_EVENTS_LIMIT:
+			dropped_events = len(self.events) - JOB_EVENTS_LIMIT
+			del self.events[:dropped_events]
+			self.event_offset += dropped_events
+		asyncio.get_running_loop().create_task(self.notify())
+
+
+	async def notify(self):
+		async with self.changed:
+			self.changed.notify_all()
+
+
+	def to_dict(self):
+		return {
+			'id': self.job_id,
+			'spec': self.spec,
+			'priority': self.priority,
+			'status': self.status,
+			'cancel_requested': self.cancel_requested,
+			'returncode': self.returncode,
+			'created': self.created,
+			'started': self.started,
+			'finished': self.finished,
+			'last_event': self.events[-1]['message'] if self.events else None,
+		}
+
+
+
+class JobServer:
+	def __init__(self, options, max_jobs=2, token=None, journal=None):
+		self.options = options
+		self.max_jobs = max_jobs
+		self.token = token
+		self.journal = journal
+		self.journal_lock = threading.Lock()
+		self.allowed_hosts = set(LOOPBACK_HOSTS)
+		self.jobs = {}
+		self.job_ids = itertools.count(1)
+		self.sequence = itertools.count()
+		self.queue = None
+		self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+
+
+	async def start(self, host, port):
+		self.queue = asyncio.PriorityQueue()
+		# Bound to a LAN address on purpose, clients then name that address in their Host header
+		if host not in ('', '0.0.0.0', '::'):
+			self.allowed_hosts.add(host)
+		self.restore_jobs()
+		self.workers = [asyncio.create_task(self.worker()) for _ in range(self.max_jobs)]
+		return await asyncio.start_server(self.handle_connection, host, port)
+
+
+	def submit(self, spec, priority=0, journal_id=None, journal_entry=None):
+		validate_job(self.options, spec)
+		if self.journal and journal_id is None:
+			journal_id = self.journal.add('server', {'spec': spec, 'priority': priority, 'completed_urls': []})
+		# Journaled jobs keep their journal id, so clients still find them after a restart
+		job = Job(str(journal_id if journal_id is not None else next(self.job_ids)), spec, priority)
+		if journal_entry:
+			job.journal_entry = journal_entry
+		self.jobs[job.job_id] = job
+		# Higher priorities first, submission order among equal ones
+		self.queue.put_nowait((-priority, next(self.sequence), job))
+		return job
+
+
+	def restore_jobs(self):
+		# Jobs still queued or running in the journal were cut off when the server stopped, only their unfinished part runs again
+		if not self.journal:
+			return
+		for journal_id, entry in self.journal.unfinished('server'):
+			entry.setdefault('completed_urls', [])
+			try:
+				spec = remaining_job(self.options, entry['spec'], entry['completed_urls'])
+				if spec is None:
+					self.journal.set_state(journal_id, JobJournal.COMPLETE)
+					continue
+				job = self.submit(spec, entry.get('priority', 0), journal_id, entry)
+			except (ValueError, TypeError, KeyError, AttributeError) as e:
+				print(f"Dropping journaled job {journal_id}: {str(e)}", file=sys.stderr, flush=True)
+				self.journal.set_state(journal_id, JobJournal.FAILED)
+				continue
+			job.add_event("Queued again after a server restart")
+
+
+	def set_journal_state(self, job, state):
+		if self.journal:
+			self.journal.set_state(int(job.job_id), state)
+
+
+	def record_item_done(self, job, url):
+		# Called from the job's download threads, a later restore skips the URLs recorded here
+		if not self.journal:
+			return
+		with self.journal_lock:
+			job.journal_entry['completed_urls'].append(url)
+			self.journal.update_spec(int(job.job_id), job.journal_entry)
+
+
+	async def cancel(self, job):
+		if job.status == 'queued':
+			job.status = 'cancelled'
+			job.finished = time.time()
+			job.add_event("Cancelled before it started")
+			self.set_journal_state(job, JobJournal.CANCELLED)
+		elif job.status == 'running' and not job.cancel_requested:
+			job.cancel_requested = True
+			job.cancel_token.cancel()
+			job.add_event("Cancelling...")
+		await job.notify()
+
+
+	async def worker(self):
+		loop = asyncio.get_running_loop()
+		while True:
+			_, _, job = await self.queue.get()
+			if job.status != 'queued':
+				continue
+
+			job.status = 'running'
+			job.started = time.time()
+			self.set_journal_state(job, JobJournal.RUNNING)
+			metrics.observe('oni_queue_wait_seconds', job.started - job.created, queue='job_server')
+			def log(message, job=job):
+				try:
+					loop.call_soon_threadsafe(job.add_event, message)
+				except RuntimeError:
+					pass  # The loop is already closed while the server shuts down
+			# Throttled like in the GUI, otherwise fast downloads push their finished lines out of the capped event list
+			progress_log = ProgressThrottle(log, self.options.get("performance_options", {}).get("progress_interval", 1.0))
+			try:
+				job.returncode = await loop.run_in_executor(
+					self.executor, run_job, self.options, job.spec, progress_log, job.cancel_token, lambda url, job=job: self.record_item_done(job, url))
+			except JobCancelled:
+				job.returncode = 1
+			except Exception as e:
+				job.add_event(f"Error: {str(e)}")
+				job.returncode = 1
+			finally:
+				progress_log.flush()
+
+			if job.cancel_requested:
+				job.status = 'cancelled'
+				job.add_event("Cancelled")
+			else:
+				job.status = 'finished' if job.returncode == 0 else 'failed'
+			job.finished = time.time()
+			self.set_journal_state(job, {'cancelled': JobJournal.CANCELLED, 'finished': JobJournal.COMPLETE}.get(job.status, JobJournal.FAILED))
+			metrics.event(
+				'server_job', id=job.job_id, type=job.spec.get('type'), priority=job.priority, status=job.status, returncode=job.returncode,
+				queue_wait=round(job.started - job.created, 3), seconds=round(job.finished - job.started, 3))
+			await job.notify()
+
+
+	async def handle_connection(self, reader, writer):
+		try:
+			request_line = (await reader.readline()).decode('latin-1')
+			method, target, _ = request_line.split(' ', 2)
+			headers = {}
+			while True:
+				line = await reader.readline()
+				if line in (b'\r\n', b'\n', b''):
+					break
+				name, _, value = line.decode('latin-1').partition(':')
+				headers[name.strip().lower()] = value.strip()
+
+			rejection = self.reject_request(method.upper(), headers)
+			if rejection:
+				return await self.send_json(writer, rejection[0], {'error': rejection[1]})
+
+			content_length = int(headers.get('content-length', 0))
+			body = await reader.readexactly(content_length) if content_length else b''
+			await self.route(method.upper(), urlsplit(target).path.rstrip('/'), body, writer)
+		except (ValueError, asyncio.IncompleteReadError):
+			await self.send_json(writer, 400, {'error': 'Malformed request'})
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+
+	def reject_request(self, method, headers):
+		# Browsers add an Origin to requests from other pages, the CLI and scripts never send one
+		if 'origin' in headers:
+			return 403, "Cross-origin requests are not allowed"
+		# A rebound DNS name reaches the loopback address too, but keeps its own name in Host
+		if urlsplit('//' + headers.get('host', '')).hostname not in self.allowed_hosts:
+			return 403, "Unknown Host"
+		# Pages can post text/plain without a preflight, only JSON bodies are read
+		if method == 'POST' and headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+			return 415, "Content-Type must be application/json"
+		if self.token and not hmac.compare_digest(headers.get('authorization', '').encode('latin-1'), f'Bearer {self.token}'.encode('latin-1')):
+			return 401, "Missing or wrong job server token"
+		return None
+
+
+	async def route(self, method, path, body, writer):
+		parts = path.strip('/').split('/')
+		if parts == ['metrics'] and method == 'GET':
+			return await self.send_metrics(writer)
+		if parts[0] != 'jobs':
+			return await self.send_json(writer, 404, {'error': 'Not found'})
+
+		if len(parts) == 1:
+			if method == 'GET':
+				return await self.send_json(writer, 200, {'jobs': [job.to_dict() for job in self.jobs.values()]})
+			if method == 'POST':
+				try:
+					request = json.loads(body or b'{}')
+					job = self.submit(request.get('spec', request), int(request.get('priority', 0)))
+				except (ValueError, TypeError, AttributeError) as e:
+					return await self.send_json(writer, 400, {'error': str(e)})
+				return await self.send_json(writer, 201, job.to_dict())
+			return await self.send_json(writer, 405, {'error': 'Method not allowed'})
+
+		job = self.jobs.get(parts[1])
+		if job is None:
+			return await self.send_json(writer, 404, {'error': 'Unknown job'})
+
+		if len(parts) == 2 and method == 'GET':
+			return await self.send_json(writer, 200, job.to_dict())
+		if len(parts) == 2 and method == 'DELETE':
+			await self.cancel(job)
+			return await self.send_json(writer, 200, job.to_dict())
+		if len(parts) == 3 and parts[2] == 'events' and method == 'GET':
+			return await self.stream_events(job, writer)
+		return await self.send_json(writer, 404, {'error': 'Not found'})
+
+
+	async def send_json(self, writer, status, payload):
+		body = json.dumps(payload).encode('utf-8')
+		writer.write(
+			f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+			f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+		await writer.drain()
+
+
+	async def send_metrics(self, writer):
+		for status in ('queued', 'running', *FINAL_STATUSES):
+			metrics.set_gauge('oni_server_jobs', sum(1 for job in self.jobs.values() if job.status == status), status=status)
+		body = metrics.render().encode('utf-8')
+		writer.write(
+			f"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+			f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+		await writer.drain()
+
+
+	async def stream_events(self, job, writer):
+		# One JSON object per line until the job ends, the last line carries the final status
+		writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n")
+		position = 0
+		while True:
+			async with job.changed:
+				events = job.events[max(position - job.event_offset, 0):]
+				position = job.event_offset + len(job.events)
+				done = job.status in FINAL_STATUSES
+				if not events and not done:
+					try:
+						await asyncio.wait_for(job.changed.wait(), KEEPALIVE_INTERVAL)
+					except asyncio.TimeoutError:
+						writer.write(b'\n')
+						await writer.drain()
+					continue
+
+			writer.write(b''.join(json.dumps(event).encode('utf-8') + b'\n' for event in events))
+			if done:
+				writer.write(json.dumps({'status': job.status, 'returncode': job.returncode}).encode('utf-8') + b'\n')
+			await writer.drain()
+			if done:
+				return
+
+
+	def shutdown(self):
+		# Running jobs get cancelled and drain here, their ffmpeg children are stopped by the cancellation tokens.
+		# The journal keeps them unfinished, the next serve queues them again
+		for job in self.jobs.values():
+			if job.status in ('queued', 'running'):
+				job.cancel_token.cancel()
+		self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+""" The class end here """
+
+
+def serve(options, host='127.0.0.1', port=8770, max_jobs=2):
+	job_journal = open_job_journal()
+	job_journal.prune()
+	job_server = JobServer(options, max_jobs, create_server_token(), job_journal)
+
+	async def run_server():
+		server = await job_server.start(host, port)
+		print(f"Job server listening on http://{host}:{port} with {max_jobs} concurrent jobs, clients authenticate with the token in {server_token_path()}", flush=True)
+		async with server:
+			await server.serve_forever()
+
+	try:
+		asyncio.run(run_server())
+	except KeyboardInterrupt:
+		print("Stopping the running jobs...", flush=True)
+	finally:
+		job_server.shutdown()
@@ -0,0 +1,242 @@
+import glob
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cancellation import CancellationToken, JobCancelled
+from conversion_cache import open_conversion_cache
+from loudness import loudness_options, open_loudness_normalizer
+from metrics import metrics
+from retry import ItemOutcomes
+from converter import BatchConverter, conversion_output_path, remove_partial_output
+from presets import find_quality_option, preset_ffmpeg_args, download_format
+
+
+
+JOB_TYPES = ('convert', 'download', 'watch')
+DOWNLOAD_ACCELERATION_OPTIONS = ('concurrent_fragments', 'auto_tune_fragments', 'http_chunk_size_mb', 'download_rate_limit', 'download_buffer_kb')
+
+
+def job_quality_option(options, spec):
+	selected_format = spec.get('format') or options["format_options"][0]
+	selected_quality = spec.get('quality')
+	if selected_quality is None:
+		selected_quality = 0
+	if isinstance(selected_quality, str) and selected_quality.isdigit():
+		selected_quality = int(selected_quality)
+
+	quality_option = find_quality_option(options["quality_options"], selected_format, selected_quality)
+	if quality_option is None:
+		names = ', '.join(q["name"] for q in options["quality_options"].get(selected_format, []))
+		raise ValueError(f"Unknown quality {selected_quality!r} for format {selected_format!r} (available: {names or 'none'})")
+	return quality_option
+
+
+def job_quality_options(options, spec):
+	# Convert jobs can list several "format/quality" presets, every input is then converted to all of them in one pass
+	if not spec.get('presets'):
+		return [job_quality_option(options, spec)]
+
+	quality_options = []
+	for preset in spec['presets']:
+		selected_format, _, selected_quality = str(preset).partition('/')
+		quality_options.append(job_quality_option(options, {'format': selected_format, 'quality': selected_quality or None}))
+	return quality_options
+
+
+def job_download_options(options, spec):
+	# Fragments, chunk size, rate limit and buffer size can be set per job over the ones in options.json
+	acceleration = spec.get('acceleration') or {}
+	unknown_settings = set(acceleration) - set(DOWNLOAD_ACCELERATION_OPTIONS)
+	if unknown_settings:
+		raise ValueError(f"Unknown download acceleration settings: {', '.join(sorted(unknown_settings))}")
+	return dict(options.get("performance_options", {}), **acceleration)
+
+
+def expand_media_files(patterns):
+	media_files = []
+	for pattern in patterns:
+		matches = sorted(glob.glob(pattern, recursive=True))
+		media_files += [match for match in matches if os.path.isfile(match)] if matches else [pattern]
+	return media_files
+
+
+def validate_job(options, spec):
+	if spec.get('type') not in JOB_TYPES:
+		raise ValueError(f"Job type must be one of {', '.join(JOB_TYPES)}")
+	if spec['type'] == 'convert' and not spec.get('media'):
+		raise ValueError("Convert jobs need a non-empty 'media' list")
+	if spec['type'] == 'watch' and not os.path.isdir(spec.get('folder') or ''):
+		raise ValueError("Watch jobs need an existing 'folder'")
+	if spec['type'] == 'download' and not spec.get('urls'):
+		raise ValueError("Download jobs need a non-empty 'urls' list")
+	if spec['type'] == 'download' and spec.get('presets'):
+		raise ValueError("Download jobs take a single format and quality, not 'presets'")
+	if spec['type'] == 'download':
+		rate_limit = job_download_options(options, spec).get("download_rate_limit")
+		if rate_limit:
+			from downloader import parse_rate_limit
+			parse_rate_limit(rate_limit)
+	job_quality_options(options, spec)
+
+
+def remaining_job(options, spec, completed_urls=()):
+	"""Return the part of an interrupted job that still has to run, None when nothing is left."""
+	if spec.get('type') == 'convert':
+		# Outputs only appear once complete, so any existing one is done and any partial one is dropped
+		remaining = [
+			(input_media, output_media_files) for input_media, output_media_files in zip(*convert_job_files(options, spec))
+			if os.path.exists(input_media) and not all(os.path.exists(output_media) for output_media in output_media_files)
+		]
+		for _, output_media_files in remaining:
+			for output_media in output_media_files:
+				remove_partial_output(output_media)
+		# Escaped, the remaining inputs are taken as they are and not as patterns
+		return dict(spec, media=[glob.escape(input_media) for input_media, _ in remaining]) if remaining else None
+
+	if spec.get('type') == 'download':
+		# Unfinished URLs continue their .part files, finished ones are not fetched and converted again
+		remaining = [url for url in spec['urls'] if url not in completed_urls]
+		return dict(spec, urls=remaining) if remaining else None
+	return spec
+
+
+def run_job(options, spec, log=print, cancel_token=None, item_done=None):
+	start_time = time.monotonic()
+	returncode = None
+	try:
+		if spec.get('type') == 'convert':
+			returncode = convert_job(options, spec, log, cancel_token)
+		elif spec.get('type') == 'watch':
+			returncode = watch_job(options, spec, log, cancel_token)
+		else:
+			returncode = download_job(options, spec, log, cancel_token, item_done)
+		return returncode
+	finally:
+		if cancel_token and cancel_token.cancelled:
+			status = 'cancelled'
+		else:
+			status = 'finished' if returncode == 0 else 'failed'
+		seconds = time.monotonic() - start_time
+		metrics.increment('oni_jobs_total', type=spec.get('type'), status=status)
+		metrics.observe('oni_job_seconds', seconds, type=spec.get('type'))
+		metrics.event('job', type=spec.get('type'), status=status, returncode=returncode, seconds=round(seconds, 3))
+
+
+def job_segments(performance_options, spec):
+	# Segment-parallel encoding is opt-in, per job or for every job through the options
+	segments = spec.get('segments')
+	if segments is None and performance_options.get("segmented_encoding"):
+		segments = performance_options.get("segment_count") or os.cpu_count() or 1
+	return segments or 0
+
+
+def convert_job_files(options, spec):
+	quality_options = job_quality_options(options, spec)
+	input_media_files = expand_media_files(spec['media'])
+	destination = spec.get('destination') or os.path.join(os.getcwd(), "converted")
+	output_media_files = [
+		[
+			conversion_output_path(destination, media, quality_option["name"], options["format_to_extension"].get(quality_option["format"], 'mp4'))
+			for quality_option in quality_options
+		]
+		for media in input_media_files
+	]
+	return input_media_files, output_media_files
+
+
+def convert_job(options, spec, log=print, cancel_token=None):
+	quality_options = job_quality_options(options, spec)
+	performance_options = options.get("performance_options", {})
+	input_media_files, output_media_files = convert_job_files(options, spec)
+	if not input_media_files:
+		raise ValueError("No media files matched")
+
+	os.makedirs(spec.get('destination') or os.path.join(os.getcwd(), "converted"), exist_ok=True)
+	batch_converter = BatchConverter(
+		input_media_files, [preset_ffmpeg_args(quality_option) for quality_option in quality_options], output_media_files,
+		spec.get('workers') or performance_options.get("conversion_workers"), performance_options.get("progress_interval", 1.0), log, cancel_token,
+		job_segments(performance_options, spec), performance_options.get("segment_min_duration", 600),
+		open_conversion_cache(performance_options) if spec.get('cache', True) else None,
+		open_loudness_normalizer(loudness_options(performance_options, spec.get('normalize_loudness'))))
+	completed_files = batch_converter.run()
+	return 0 if completed_files == len(input_media_files) else 1
+
+
+def watch_job(options, spec, log=print, cancel_token=None):
+	from hot_folder import HotFolder
+
+	# Runs until it is cancelled, every stable new file in the folder is converted to the presets
+	performance_options = loudness_options(options.get("performance_options", {}), spec.get('normalize_loudness'))
+	hot_folder = HotFolder(
+		spec['folder'], spec.get('destination') or os.path.join(os.getcwd(), "converted"), job_quality_options(options, spec),
+		options["format_to_extension"], performance_options, log, cancel_token,
+		open_conversion_cache(performance_options) if spec.get('cache', True) else None,
+		workers=spec.get('workers'), segments=job_segments(performance_options, spec))
+	hot_folder.run()
+	return 0
+
+
+def download_job(options, spec, log=print, cancel_token=None, item_done=None):
+	# yt_dlp takes a while to import, so only download jobs pay for it
+	from downloader import Downloader, build_ydl_opts, open_metadata_cache, open_download_archive, open_fragment_tuner, url_host
+
+	quality_option = job_quality_option(options, spec)
+	performance_options = loudness_options(job_download_options(options, spec), spec.get('normalize_loudness'))
+	cancel_token = cancel_token or CancellationToken()
+	urls = spec['urls']
+	playlist = bool(spec.get('playlist'))
+
+	destination = spec.get('destination') or os.path.join(os.getcwd(), "download")
+	os.makedirs(destination, exist_ok=True)
+	metadata_cache = open_metadata_cache(performance_options)
+	download_archive = open_download_archive() if spec.get('sync') else None
+	fragment_tuner = open_fragment_tuner(performance_options)
+	selected_download_format = download_format(options.get("format_to_download_format", {}), quality_option)
+
+	max_downloads = spec.get('workers') or performance_options.get("max_concurrent_downloads") or 1
+	max_per_host = performance_options.get("max_downloads_per_host") or max_downloads
+	host_slots = {}
+	host_slots_lock = threading.Lock()
+	outcomes = ItemOutcomes()
+
+	def run_download(queue_number, url):
+		with host_slots_lock:
+			host_slot = host_slots.setdefault(url_host(url), threading.Semaphore(max_per_host))
+		queued_at = time.monotonic()
+		with host_slot:
+			metrics.observe('oni_queue_wait_seconds', time.monotonic() - queued_at, queue='host')
+			cancel_token.raise_if_cancelled()
+			ydl_opts = dict(build_ydl_opts(destination, selected_download_format, playlist, performance_options), quiet=True, noprogress=True)
+			downloader = Downloader(
+				url, ydl_opts, quality_option, destination, options["format_to_extension"], playlist, performance_options,
+				metadata_cache, bool(spec.get('refresh_metadata')), download_archive,
+				lambda message: log(f"[#{queue_number}] {message}" if len(urls) > 1 else message), cancel_token, fragment_tuner)
+			try:
+				downloader.run()
+			finally:
+				outcomes.retried(url, downloader.outcomes.total_retries())
+			# A playlist whose entries partly failed still fails as a whole, its own summary lists which ones
+			failed_entries = downloader.outcomes.count(ItemOutcomes.FAILED)
+			if failed_entries:
+				raise RuntimeError(f"{failed_entries} playlist entries failed")
+
+	# Every URL runs to its own outcome, one failure does not stop the rest of the batch
+	with ThreadPoolExecutor(max_workers=max_downloads) as executor:
+		futures = {executor.submit(run_download, queue_number, url): url for queue_number, url in enumerate(urls, start=1)}
+		for future in as_completed(futures):
+			try:
+				future.result()
+				outcomes.record(futures[future], ItemOutcomes.SUCCEEDED)
+				if item_done:
+					item_done(futures[future])
+			except JobCancelled:
+				outcomes.record(futures[future], ItemOutcomes.CANCELLED)
+			except Exception as e:
+				outcomes.record(futures[future], ItemOutcomes.FAILED, str(e))
+				log(f"Error: {futures[future]}: {str(e)}")
+
+	log(outcomes.summary())
+	return 0 if outcomes.count(ItemOutcomes.SUCCEEDED) == len(urls) else 1
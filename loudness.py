@@ -0,0 +1,124 @@
+import json
+import math
+import re
+import sqlite3
+
+from ffmpeg_process import FfmpegError, FfmpegProcess
+from loudness_cache import open_loudness_cache
+
+
+
+# loudnorm prints its first pass measurements as a JSON object once the input ends
+MEASUREMENT_PATTERN = re.compile(r'\{[^{}]*"input_i"[^{}]*\}')
+
+# Quieter than this the source is silence, normalizing it would only amplify the noise floor
+SILENCE_LOUDNESS = -70.0
+
+# loudnorm works at 192 kHz, the output goes back to the source rate, or to this one when it is unknown
+DEFAULT_SAMPLE_RATE = 48000
+
+
+def loudness_options(performance_options, normalize_loudness=None):
+	# A job or tab setting wins over loudness_normalization in options.json, None keeps the option
+	if normalize_loudness is None:
+		return performance_options
+	return dict(performance_options, loudness_normalization=bool(normalize_loudness))
+
+
+def open_loudness_normalizer(performance_options):
+	if not performance_options.get("loudness_normalization"):
+		return None
+	return LoudnessNormalizer(
+		performance_options.get("loudness_target", -16), performance_options.get("loudness_true_peak", -1.5),
+		performance_options.get("loudness_range", 11), open_loudness_cache(performance_options))
+
+
+def add_audio_filter(ffmpeg_args, audio_filter):
+	# A preset with its own -af keeps it, loudnorm runs after it
+	tokens = ffmpeg_args.split()
+	if '-af' in tokens[:-1]:
+		index = tokens.index('-af') + 1
+		tokens[index] = f'{tokens[index]},{audio_filter}'
+	else:
+		tokens += ['-af', audio_filter]
+	return ' '.join(tokens)
+
+
+def parse_loudness_measurement(stderr_lines, sample_rate=None):
+	match = MEASUREMENT_PATTERN.search('\n'.join(stderr_lines))
+	if not match:
+		return None
+
+	values = json.loads(match.group(0))
+	measurement = {name: float(values[name]) for name in ('input_i', 'input_tp', 'input_lra', 'input_thresh')}
+	if not all(math.isfinite(value) for value in measurement.values()) or measurement['input_i'] < SILENCE_LOUDNESS:
+		return None
+
+	measurement['sample_rate'] = sample_rate or DEFAULT_SAMPLE_RATE
+	return measurement
+
+
+def measure_loudness(input_media, progress_callback=None, progress_interval=1.0, cancel_token=None):
+	"""Run the first loudnorm pass over the audio, None when the source has no audio to normalize."""
+	ffmpeg_process = FfmpegProcess(
+		['ffmpeg', '-hide_banner', '-i', input_media, '-vn', '-sn', '-dn', '-af', 'loudnorm=print_format=json', '-f', 'null', '-'],
+		progress_callback, progress_interval, cancel_token)
+	returncode = ffmpeg_process.run()
+	if returncode != 0:
+		if any('does not contain any stream' in line for line in ffmpeg_process.stderr_tail):
+			return None
+		raise FfmpegError(returncode, ffmpeg_process.stderr_tail)
+	# The source rate is read from the input banner as it goes by, the output one is loudnorm's 192 kHz
+	return parse_loudness_measurement(ffmpeg_process.stderr_tail, ffmpeg_process.sample_rate)
+
+
+
+class LoudnessNormalizer:
+	def __init__(self, integrated=-16, true_peak=-1.5, loudness_range=11, cache=None):
+		self.target_filter = f'loudnorm=I={integrated}:TP={true_peak}:LRA={loudness_range}'
+		self.cache = cache
+
+
+	def cache_args(self, ffmpeg_args):
+		# Converted outputs are cached by target, the measurement already follows from the source
+		return add_audio_filter(ffmpeg_args, self.target_filter)
+
+
+	def measure(self, input_media, log=print, progress_callback=None, progress_interval=1.0, cancel_token=None):
+		"""Return (measurement, cached), the analysis pass only runs for a source that was never measured."""
+		if self.cache:
+			try:
+				found, measurement = self.cache.fetch(input_media)
+				if found:
+					return measurement, True
+			except (OSError, sqlite3.Error) as e:
+				log(f"Loudness cache lookup failed for {input_media}: {str(e)}")
+
+		measurement = measure_loudness(input_media, progress_callback, progress_interval, cancel_token)
+		if self.cache:
+			try:
+				self.cache.store(input_media, measurement)
+			except (OSError, sqlite3.Error) as e:
+				log(f"Could not add the loudness of {input_media} to the cache: {str(e)}")
+		return measurement, False
+
+
+	def ffmpeg_args(self, ffmpeg_args, measurement):
+		if measurement is None:
+			return ffmpeg_args
+		# With the measurement loudnorm can apply one linear gain instead of compressing dynamically
+		return add_audio_filter(ffmpeg_args, (
+			f"{self.target_filter}:measured_I={measurement['input_i']}:measured_TP={measurement['input_tp']}:"
+			f"measured_LRA={measurement['input_lra']}:measured_thresh={measurement['input_thresh']}:linear=true,"
+			f"aresample={measurement['sample_rate']}"))
+
+
+	def describe(self, name, measurement, cached):
+		if measurement is None:
+			return f"No audio to normalize in {name}"
+		return (
+			f"Loudness of {name}: {measurement['input_i']:.1f} LUFS, true peak {measurement['input_tp']:.1f} dBTP, "
+			f"range {measurement['input_lra']:.1f} LU{' (cached)' if cached else ''}")
+
+
+""" The class end here """
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import closing
+
+from conversion_cache import source_key
+from ffmpeg_process import ffmpeg_version
+
+
+
+MEASUREMENT_NAMES = ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'sample_rate')
+
+
+def open_loudness_cache(performance_options):
+	return LoudnessCache(os.path.join(os.getcwd(), "cache", "loudness.sqlite3"), performance_options.get("conversion_cache_key", "stat"))
+
+
+
+class LoudnessCache:
+	def __init__(self, path, key_mode='stat'):
+		self.path = path
+		self.key_mode = key_mode
+		self.lock = threading.Lock()
+
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with self.connect() as connection:
+			connection.execute('PRAGMA journal_mode=WAL')
+			# A row without measurements is a source with nothing to normalize, so it is not analysed again either
+			connection.execute(
+				'CREATE TABLE IF NOT EXISTS measurements ('
+				'key TEXT PRIMARY KEY, source TEXT NOT NULL, input_i REAL, input_tp REAL, input_lra REAL, '
+				'input_thresh REAL, sample_rate INTEGER, created REAL NOT NULL)')
+
+
+	def connect(self):
+		return closing(sqlite3.connect(self.path, timeout=30))
+
+
+	def cache_key(self, input_media):
+		# The first pass measures the source alone, the target loudness and the output bitrate only matter in the second pass
+		return hashlib.sha256(json.dumps([source_key(input_media, self.key_mode), ffmpeg_version()]).encode('utf-8')).hexdigest()
+
+
+	def fetch(self, input_media):
+		"""Return (found, measurement), the measurement is None for sources without audio to normalize."""
+		key = self.cache_key(input_media)
+		with self.lock, self.connect() as connection:
+			row = connection.execute(f'SELECT {", ".join(MEASUREMENT_NAMES)} FROM measurements WHERE key = ?', (key,)).fetchone()
+		if row is None:
+			return False, None
+		if row[0] is None:
+			return True, None
+		return True, dict(zip(MEASUREMENT_NAMES, row))
+
+
+	def store(self, input_media, measurement):
+		key = self.cache_key(input_media)
+		values = [(measurement or {}).get(name) for name in MEASUREMENT_NAMES]
+		with self.lock, self.connect() as connection, connection:
+			connection.execute(
+				f'INSERT OR REPLACE INTO measurements (key, source, {", ".join(MEASUREMENT_NAMES)}, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				(key, os.path.abspath(input_media), *values, time.time()))
+
+
+	def count(self):
+		with self.lock, self.connect() as connection:
+			return connection.execute('SELECT COUNT(*) FROM measurements').fetchone()[0]
+
+
+	def clear(self):
+		with self.lock, self.connect() as connection, connection:
+			connection.execute('DELETE FROM measurements')
+
+
+""" The class end here """
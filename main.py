@@ -1,18 +1,50 @@
 import sys
 import os
-import json
 import threading
+import time
 
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QComboBox, QLineEdit, QVBoxLayout, QHBoxLayout, QShortcut, QTabWidget, QFileDialog, QProgressBar, QMessageBox, QTextEdit
-from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QThread
-from download import DownloadTab
-from convert import MediaConversionTab
+# Imported first, so its clock starts before the heavy imports below
+from startup_timing import startup_timer, startup_report_enabled
+
+with startup_timer.phase("import PyQt5"):
+	from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QComboBox, QLineEdit, QVBoxLayout, QHBoxLayout, QShortcut, QTabWidget, QFileDialog, QProgressBar, QMessageBox, QTextEdit
+	from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QThread, QTimer
+with startup_timer.phase("import download tab"):
+	from download import DownloadTab
+with startup_timer.phase("import conversion tab"):
+	from convert import MediaConversionTab
+from presets import load_options
+from metrics import configure_metrics, metrics
+
+
+
+def warm_up(report=False):
+	# Runs once the window is up, so the first download does not stall on imports while the user is still typing a URL
+	started = time.perf_counter()
+	try:
+		import yt_dlp
+		from yt_dlp.extractor import gen_extractor_classes
+		from ffmpeg_process import ffmpeg_version
+
+		gen_extractor_classes()
+		yt_dlp.YoutubeDL({'quiet': True}).close()
+		ffmpeg_version()
+	except Exception as e:
+		print(f"Background warm-up failed: {str(e)}", file=sys.stderr, flush=True)
+	startup_timer.record("background warm-up (yt_dlp, extractors, ffmpeg)", time.perf_counter() - started)
+	if report:
+		print(startup_timer.report(), file=sys.stderr, flush=True)
+
+
+def start_warm_up(report=False):
+	threading.Thread(target=warm_up, args=(report,), name="warm-up", daemon=True).start()
 
 
 
 class CustomWindow(QWidget):
-	def __init__(self):
+	def __init__(self, options=None):
 		super().__init__()
+		self.options = options
 		self.initUI()
 
 	def initUI(self):
@@ -29,43 +61,58 @@ class CustomWindow(QWidget):
 		main_layout.addWidget(tab_widget)
 
 
-		with open('options.json', 'r') as file:
-			options = json.load(file)
-			format_options = options["format_options"]
-			quality_options = options["quality_options"]
-			format_to_extension = options["format_to_extension"]
+		# The caller may have read the options already, they are not read from disk a second time
+		options = self.options or load_options()
+		format_options = options["format_options"]
+		quality_options = options["quality_options"]
+		format_to_extension = options["format_to_extension"]
+		format_to_download_format = options.get("format_to_download_format", {})
+		performance_options = options.get("performance_options", {})
+		configure_metrics(performance_options)
 
 
         # Add Tab
-		tab1 = DownloadTab(format_options, quality_options, format_to_extension)
+		with startup_timer.phase("create download tab"):
+			tab1 = DownloadTab(format_options, quality_options, format_to_extension, performance_options, format_to_download_format)
 		tab_widget.addTab(tab1, "Download")
-		tab2 = MediaConversionTab(format_options, quality_options, format_to_extension)
+		with startup_timer.phase("create conversion tab"):
+			tab2 = MediaConversionTab(format_options, quality_options, format_to_extension, performance_options)
 		tab_widget.addTab(tab2, "Media Conversion")
 
 
-		def closeEvent(self, event):
-        # Stop any running threads in each tab
-			tab_widget = self.findChild(QTabWidget)
-			for index in range(tab_widget.count()):
-				current_tab_widget = tab_widget.widget(index)
-				if hasattr(current_tab_widget, "stop_download_thread"):
-					current_tab_widget.stop_download_thread()
-					current_tab_widget.download_thread.finished.connect(self.handle_thread_finished)
-				if hasattr(current_tab_widget, "stop_convert_thread"):
-					current_tab_widget.stop_convert_thread()
-					current_tab_widget.convert_thread.finished.connect(self.handle_thread_finished)
-			event.accept()
+	def closeEvent(self, event):
+        # Stop any running threads in each tab, the job journal picks their work up again on the next start
+		tab_widget = self.findChild(QTabWidget)
+		for index in range(tab_widget.count()):
+			current_tab_widget = tab_widget.widget(index)
+			if hasattr(current_tab_widget, "stop_download_thread"):
+				current_tab_widget.stop_download_thread()
+			if hasattr(current_tab_widget, "stop_convert_thread"):
+				current_tab_widget.stop_convert_thread()
+		event.accept()
+
 
 
-	def handle_thread_finished(self):
-		event = getattr(self, "_close_event", None)
-		if event:
-			event.accept()
+def report_startup(performance_options):
+	# Called from the event loop, so it measures up to the first frame the user actually sees
+	shown_seconds = startup_timer.elapsed()
+	metrics.observe('oni_startup_seconds', shown_seconds)
+	metrics.event('startup', seconds=round(shown_seconds, 3), phases={name: round(cumulative, 4) for name, _, _, cumulative in startup_timer.phases})
+	if startup_report_enabled(performance_options):
+		print(startup_timer.report(), file=sys.stderr, flush=True)
 
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = CustomWindow()
-    window.show()
+    with startup_timer.phase("create application"):
+        app = QApplication(sys.argv)
+    with startup_timer.phase("read options"):
+        options = load_options()
+    with startup_timer.phase("create window"):
+        window = CustomWindow(options)
+        window.show()
+    performance_options = options.get("performance_options", {})
+    QTimer.singleShot(0, lambda: report_startup(performance_options))
+    # The warm-up ends after the window shows, so with the report enabled it prints the report again with its line
+    QTimer.singleShot(0, lambda: start_warm_up(startup_report_enabled(performance_options)))
     sys.exit(app.exec_())
@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+
+from functools import lru_cache
+from ffmpeg_process import NO_WINDOW, parse_duration
+
+
+
+# Settings that only tune the encoder, an explicit codec choice is not one of them
+ENCODER_ONLY_ARGS = ('-preset', '-tune', '-threads', '-crf')
+
+CONTAINER_CODECS = {
+	'mp3': {'audio': ('mp3',), 'video': ()},
+	'mp4': {'audio': ('aac', 'mp3'), 'video': ('h264',)},
+}
+
+
+def probe_media(media):
+	stat = os.stat(media)
+	return _probe_media(os.path.abspath(media), stat.st_size, stat.st_mtime)
+
+
+@lru_cache(maxsize=1024)
+def _probe_media(media, size, mtime):
+	# size and mtime are part of the cache key so a file replaced in place gets probed again
+	ffprobe_command = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format', media]
+	result = subprocess.run(ffprobe_command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, check=True, creationflags=NO_WINDOW)
+	return json.loads(result.stdout)
+
+
+def describe_media(media):
+	"""Return (duration, has_video, has_audio), from ffprobe when available and from ffmpeg's input banner otherwise."""
+	try:
+		probe = probe_media(media)
+		streams = probe.get('streams', [])
+		duration = probe.get('format', {}).get('duration')
+		return (
+			float(duration) if duration else None,
+			any(stream.get('codec_type') == 'video' and not stream.get('disposition', {}).get('attached_pic') for stream in streams),
+			any(stream.get('codec_type') == 'audio' for stream in streams))
+	except (OSError, ValueError, subprocess.CalledProcessError):
+		pass
+
+	# ffmpeg prints the input description before it complains about the missing output
+	result = subprocess.run(
+		['ffmpeg', '-hide_banner', '-i', media], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+		text=True, encoding='utf-8', errors='replace', creationflags=NO_WINDOW)
+	lines = result.stderr.splitlines()
+	return (
+		parse_duration(result.stderr),
+		any('Video:' in line and 'attached pic' not in line for line in lines),
+		any('Audio:' in line for line in lines))
+
+
+def parse_preset_args(ffmpeg_args):
+	tokens = ffmpeg_args.split()
+	return dict(zip(tokens[::2], tokens[1::2])) if len(tokens) % 2 == 0 else None
+
+
+def bitrate_matches(stream_bitrate, target_bitrate, tolerance=0.05):
+	units = {'k': 1000, 'm': 1000000}
+	target = target_bitrate.lower()
+	target = float(target[:-1]) * units[target[-1]] if target[-1] in units else float(target)
+	return abs(int(stream_bitrate) - target) <= target * tolerance
+
+
+def stream_copy_args(input_media, ffmpeg_args, output_media):
+	"""Return (ffmpeg_args, decision) with the cheapest args that still honour the preset."""
+	output_extension = os.path.splitext(output_media)[1].lstrip('.').lower()
+	preset_args = parse_preset_args(ffmpeg_args)
+	if output_extension not in CONTAINER_CODECS or preset_args is None:
+		return ffmpeg_args.split(), "re-encode (preset not analysed)"
+
+	try:
+		probe = probe_media(input_media)
+	except (OSError, ValueError, subprocess.CalledProcessError) as e:
+		return ffmpeg_args.split(), f"re-encode (probe failed: {str(e)})"
+
+	streams = probe.get('streams', [])
+	audio_streams = [stream for stream in streams if stream.get('codec_type') == 'audio']
+	video_streams = [stream for stream in streams
+		if stream.get('codec_type') == 'video' and not stream.get('disposition', {}).get('attached_pic')]
+	codecs = CONTAINER_CODECS[output_extension]
+
+	unknown_args = [arg for arg in preset_args if arg not in ('-vf', '-b:a', *ENCODER_ONLY_ARGS)]
+	if unknown_args:
+		return ffmpeg_args.split(), f"re-encode (preset uses {' '.join(unknown_args)})"
+
+	audio_copy = all(
+		stream.get('codec_name') in codecs['audio']
+		and ('-b:a' not in preset_args or bitrate_matches(stream.get('bit_rate') or probe.get('format', {}).get('bit_rate', 0), preset_args['-b:a']))
+		for stream in audio_streams)
+
+	video_copy = all(
+		stream.get('codec_name') in codecs['video']
+		and ('-vf' not in preset_args or preset_args['-vf'] == f"scale={stream.get('width')}:{stream.get('height')}")
+		for stream in video_streams)
+
+	if not codecs['video']:
+		# Audio only containers drop the video anyway, cover art is kept when there is nothing else
+		if audio_streams and audio_copy:
+			return (['-vn', '-c:a', 'copy'] if video_streams else ['-c', 'copy']), "audio stream copy (source already matches the preset)"
+		return ffmpeg_args.split(), "re-encode (source does not match the preset)"
+
+	if (audio_streams or video_streams) and audio_copy and video_copy:
+		# Copied subtitles keep their codec, mp4 only takes mov_text ones and no data streams, so an mkv's would fail the remux
+		if any(stream.get('codec_type') in ('subtitle', 'data') for stream in streams):
+			return ['-c', 'copy', '-sn', '-dn'], "stream copy (source already matches the preset, subtitle and data streams dropped)"
+		return ['-c', 'copy'], "stream copy (source already matches the preset)"
+	if audio_streams and audio_copy:
+		return [*ffmpeg_args.split(), '-c:a', 'copy'], "audio stream copy (video needs re-encoding)"
+	return ffmpeg_args.split(), "re-encode (source does not match the preset)"
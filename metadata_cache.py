@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import closing
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+
+
+TRACKING_PARAMETERS = ('si', 'feature', 'fbclid', 'gclid', 'pp')
+
+# yt-dlp options that change what the extractor returns for the same URL, e.g. one video or the whole playlist it sits in
+RESOLVE_OPTIONS = ('noplaylist', 'extract_flat', 'extractor_args', 'playlist_items', 'playliststart', 'playlistend', 'cookiefile', 'age_limit')
+
+
+def normalize_url(url):
+	parsed = urlparse(url.strip())
+	host = (parsed.hostname or '').lower()
+	for prefix in ('www.', 'm.'):
+		if host.startswith(prefix):
+			host = host[len(prefix):]
+
+	path = parsed.path or '/'
+	query = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+		if key not in TRACKING_PARAMETERS and not key.startswith('utm_')]
+
+	# Short links point at the same video as the regular watch page
+	if host == 'youtu.be' and len(path) > 1:
+		query.append(('v', path.lstrip('/')))
+		host, path = 'youtube.com', '/watch'
+
+	netloc = f'{host}:{parsed.port}' if parsed.port else host
+	return urlunparse((parsed.scheme.lower(), netloc, path, '', urlencode(sorted(query)), ''))
+
+
+def metadata_key(url, ydl_params=None):
+	resolve_options = {name: ydl_params[name] for name in RESOLVE_OPTIONS if ydl_params and ydl_params.get(name) is not None}
+	return f'{normalize_url(url)} {json.dumps(resolve_options, sort_keys=True, default=str)}'
+
+
+
+class MetadataCache:
+	def __init__(self, path, ttl=3600, max_size=64 * 1024 * 1024):
+		self.path = path
+		self.ttl = ttl
+		self.max_size = max_size
+		self.lock = threading.Lock()
+
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with self.connect() as connection:
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute(
+				'CREATE TABLE IF NOT EXISTS metadata ('
+				'url TEXT PRIMARY KEY, info TEXT NOT NULL, size INTEGER NOT NULL, '
+				'created REAL NOT NULL, last_access REAL NOT NULL)')
+
+
+	def connect(self):
+		return closing(sqlite3.connect(self.path, timeout=30))
+
+
+	def get(self, url, ydl_params=None):
+		key = metadata_key(url, ydl_params)
+		now = time.time()
+		with self.lock, self.connect() as connection, connection:
+			row = connection.execute('SELECT info, created FROM metadata WHERE url = ?', (key,)).fetchone()
+			if row is None:
+				return None
+
+			info, created = row
+			if now - created > self.ttl:
+				connection.execute('DELETE FROM metadata WHERE url = ?', (key,))
+				return None
+
+			connection.execute('UPDATE metadata SET last_access = ? WHERE url = ?', (now, key))
+		return json.loads(info)
+
+
+	def put(self, url, info_dict, ydl_params=None):
+		key = metadata_key(url, ydl_params)
+		info = json.dumps(info_dict)
+		now = time.time()
+		with self.lock, self.connect() as connection, connection:
+			connection.execute(
+				'INSERT OR REPLACE INTO metadata (url, info, size, created, last_access) VALUES (?, ?, ?, ?, ?)',
+				(key, info, len(info), now, now))
+			self.evict(connection)
+
+
+	def invalidate(self, url, ydl_params=None):
+		with self.lock, self.connect() as connection, connection:
+			connection.execute('DELETE FROM metadata WHERE url = ?', (metadata_key(url, ydl_params),))
+
+
+	def evict(self, connection):
+		connection.execute('DELETE FROM metadata WHERE created < ?', (time.time() - self.ttl,))
+
+		total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM metadata').fetchone()[0]
+		if total_size <= self.max_size:
+			return
+
+		# Drop the least recently used entries until the cache fits again
+		for url, size in connection.execute('SELECT url, size FROM metadata ORDER BY last_access').fetchall():
+			connection.execute('DELETE FROM metadata WHERE url = ?', (url,))
+			total_size -= size
+			if total_size <= self.max_size:
+				break
+
+
+""" The class end here """
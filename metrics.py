@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+
+from bisect import bisect_left
+
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+HELP = {
+	'oni_jobs_total': 'Finished jobs by type and status',
+	'oni_job_seconds': 'Wall time of whole jobs',
+	'oni_queue_wait_seconds': 'Time jobs and downloads waited before they started',
+	'oni_metadata_resolve_seconds': 'Time spent resolving URL metadata, from the cache or the extractor',
+	'oni_download_bytes_total': 'Bytes downloaded by yt-dlp',
+	'oni_download_seconds': 'Wall time of single media downloads',
+	'oni_ffmpeg_seconds': 'Wall time of ffmpeg runs',
+	'oni_ffmpeg_frames_total': 'Frames written by ffmpeg',
+	'oni_ffmpeg_exits_total': 'ffmpeg exits by return code',
+	'oni_conversion_seconds': 'Wall time per converted input, by result',
+	'oni_retries_total': 'Retried steps by stage',
+	'oni_server_jobs': 'Jobs currently known to the job server, by status',
+}
+
+
+def label_key(name, labels):
+	# Values are kept as text, so keys with an int and a str in the same label still sort in render
+	return (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+
+
+def label_text(labels):
+	if not labels:
+		return ''
+	escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+	return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+
+class Metrics:
+	def __init__(self, log_path=None):
+		self.lock = threading.Lock()
+		self.counters = {}
+		self.gauges = {}
+		self.histograms = {}
+		self.log_path = None
+		self.log_file = None
+		self.configure(log_path)
+
+
+	def configure(self, log_path):
+		with self.lock:
+			if self.log_file:
+				self.log_file.close()
+				self.log_file = None
+			self.log_path = log_path
+			if log_path:
+				os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+				self.log_file = open(log_path, 'a', encoding='utf-8')
+
+
+	def increment(self, name, value=1, **labels):
+		key = label_key(name, labels)
+		with self.lock:
+			self.counters[key] = self.counters.get(key, 0) + value
+
+
+	def set_gauge(self, name, value, **labels):
+		with self.lock:
+			self.gauges[label_key(name, labels)] = value
+
+
+	def observe(self, name, value, **labels):
+		key = label_key(name, labels)
+		with self.lock:
+			histogram = self.histograms.setdefault(key, [[0] * (len(DEFAULT_BUCKETS) + 1), 0.0, 0])
+			histogram[0][bisect_left(DEFAULT_BUCKETS, value)] += 1
+			histogram[1] += value
+			histogram[2] += 1
+
+
+	def event(self, kind, **fields):
+		# One JSON object per line, so the log can be grepped, tailed and loaded into any analysis tool
+		if not self.log_file:
+			return
+		line = json.dumps({'time': time.time(), 'event': kind, **fields}, default=str)
+		with self.lock:
+			if self.log_file:
+				self.log_file.write(line + '\n')
+				self.log_file.flush()
+
+
+	def render(self):
+		"""Return every counter and histogram in the Prometheus text exposition format."""
+		with self.lock:
+			counters = sorted(self.counters.items())
+			gauges = sorted(self.gauges.items())
+			histograms = sorted((key, [list(histogram[0]), histogram[1], histogram[2]]) for key, histogram in self.histograms.items())
+
+		lines = []
+		seen = set()
+		for (name, labels), value in counters:
+			if name not in seen:
+				seen.add(name)
+				lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} counter']
+			lines.append(f'{name}{label_text(labels)} {value}')
+
+		for (name, labels), value in gauges:
+			if name not in seen:
+				seen.add(name)
+				lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} gauge']
+			lines.append(f'{name}{label_text(labels)} {value}')
+
+		for (name, labels), (buckets, total, count) in histograms:
+			if name not in seen:
+				seen.add(name)
+				lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} histogram']
+			cumulative = 0
+			for bound, bucket_count in zip((*DEFAULT_BUCKETS, '+Inf'), buckets):
+				cumulative += bucket_count
+				lines.append(f'{name}_bucket{label_text((*labels, ("le", bound)))} {cumulative}')
+			lines.append(f'{name}_sum{label_text(labels)} {total}')
+			lines.append(f'{name}_count{label_text(labels)} {count}')
+		return '\n'.join(lines) + '\n'
+
+
+""" The class end here """
+
+
+metrics = Metrics()
+
+
+def configure_metrics(performance_options):
+	log_path = performance_options.get("metrics_log")
+	metrics.configure(os.path.join(os.getcwd(), log_path) if log_path else None)
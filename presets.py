@@ -0,0 +1,58 @@
+import json
+import os
+
+
+
+# Encoder settings a quality option can carry next to its ffmpeg_args, and the flag each one maps to
+ENCODER_FLAGS = {
+	'codec': '-c:v',
+	'preset': '-preset',
+	'tune': '-tune',
+	'crf': '-crf',
+	'threads': '-threads',
+}
+
+
+def load_options(path=None):
+	if path is None:
+		path = 'options.json'
+		if not os.path.exists(path):
+			path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'options.json')
+
+	with open(path, 'r') as file:
+		return json.load(file)
+
+
+def find_quality_option(quality_options, selected_format, selected_quality):
+	"""Look up a quality option by index or by name, tagged with the format it belongs to."""
+	selected_quality_options = quality_options.get(selected_format, [])
+	if isinstance(selected_quality, int):
+		if 0 <= selected_quality < len(selected_quality_options):
+			return dict(selected_quality_options[selected_quality], format=selected_format)
+		return None
+
+	for quality_option in selected_quality_options:
+		if quality_option["name"].lower() == str(selected_quality).lower():
+			return dict(quality_option, format=selected_format)
+	return None
+
+
+def preset_ffmpeg_args(quality_option):
+	ffmpeg_args = quality_option["ffmpeg_args"].split()
+	encoder = quality_option.get("encoder", {})
+	for key, flag in ENCODER_FLAGS.items():
+		if key in encoder:
+			ffmpeg_args += [flag, str(encoder[key])]
+	return ' '.join(ffmpeg_args)
+
+
+def download_format(format_to_download_format, quality_option):
+	# Only fetch the streams the selected preset needs, e.g. audio alone for mp3
+	selected_download_format = format_to_download_format.get(quality_option["format"]) if quality_option else None
+	if not selected_download_format:
+		return 'best'
+
+	try:
+		return selected_download_format.format(**quality_option)
+	except KeyError:
+		return 'best'
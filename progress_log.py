@@ -0,0 +1,77 @@
+import re
+import threading
+import time
+
+
+
+# yt-dlp and ffmpeg progress lines, optionally behind "[#2] " or "[3/10] " prefixes
+PROGRESS_PATTERN = re.compile(r'^(?P<item>(\[[^\]]*\] )*(Downloading|Converting [^\n]*?)): [^\n]*ETA: ')
+
+
+def is_progress_message(message):
+	return bool(PROGRESS_PATTERN.match(message))
+
+
+
+class ProgressThrottle:
+	def __init__(self, emit, interval=0.5):
+		self.emit = emit
+		self.interval = interval
+		self.lock = threading.Lock()
+		# Per item, so parallel downloads and conversions sharing one throttle do not hold back each other's lines
+		self.last_emit = {}
+		self.pending = {}
+		self.timers = {}
+
+
+	def __call__(self, message):
+		match = PROGRESS_PATTERN.match(message)
+		if not match:
+			# Whatever progress was held back comes first, so the last percentage is not lost behind a finished line
+			self.flush()
+			self.emit(message)
+			return
+
+		item = match.group('item')
+		with self.lock:
+			now = time.monotonic()
+			wait = self.last_emit.get(item, 0) + self.interval - now
+			if wait > 0:
+				# Progress lines only matter until the next one, the newest is kept and sent once the interval is over
+				self.pending[item] = message
+				if item not in self.timers:
+					timer = threading.Timer(wait, self.flush_item, (item,))
+					timer.daemon = True
+					self.timers[item] = timer
+					timer.start()
+				return
+			self.last_emit[item] = now
+			self.pending.pop(item, None)
+		self.emit(message)
+
+
+	def flush_item(self, item):
+		with self.lock:
+			self.timers.pop(item, None)
+			message = self.pending.pop(item, None)
+			if message is None:
+				return
+			self.last_emit[item] = time.monotonic()
+		self.emit(message)
+
+
+	def flush(self):
+		with self.lock:
+			for timer in self.timers.values():
+				timer.cancel()
+			self.timers.clear()
+			messages = list(self.pending.values())
+			now = time.monotonic()
+			for item in self.pending:
+				self.last_emit[item] = now
+			self.pending.clear()
+		for message in messages:
+			self.emit(message)
+
+
+""" The class end here """
@@ -0,0 +1,81 @@
+from PyQt5.QtWidgets import QWidget, QLabel, QListView, QPlainTextEdit, QVBoxLayout, QAbstractItemView
+from PyQt5.QtGui import QStandardItem, QStandardItemModel
+from PyQt5.QtCore import Qt
+from progress_log import is_progress_message
+
+
+
+class JobListModel(QStandardItemModel):
+	def __init__(self, max_jobs=200, parent=None):
+		super().__init__(parent)
+		self.max_jobs = max_jobs
+		self.items = {}
+
+
+	def add_job(self, key, title):
+		item = QStandardItem()
+		item.setEditable(False)
+		item.setData(title, Qt.UserRole)
+		self.items[key] = item
+		self.appendRow(item)
+		self.set_status(key, "Queued")
+
+		# Drop the oldest rows, a long session must not grow the list without bound
+		while self.rowCount() > self.max_jobs:
+			removed_item = self.takeRow(0)[0]
+			self.items = {item_key: item for item_key, item in self.items.items() if item is not removed_item}
+
+
+	def set_status(self, key, status):
+		item = self.items.get(key)
+		if item is not None:
+			item.setText(f"{item.data(Qt.UserRole)}: {status}")
+
+
+""" The class end here """
+
+
+
+class ProgressPanel(QWidget):
+	def __init__(self, performance_options=None, parent=None):
+		super().__init__(parent)
+		performance_options = performance_options or {}
+		layout = QVBoxLayout()
+		layout.setContentsMargins(0, 0, 0, 0)
+
+		jobs_label = QLabel("Jobs:", self)
+		layout.addWidget(jobs_label)
+		self.job_model = JobListModel(performance_options.get("max_listed_jobs") or 200, self)
+		self.job_view = QListView(self)
+		self.job_view.setAccessibleName("Jobs")
+		self.job_view.setToolTip("Live status of every queued, running and finished job")
+		self.job_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+		self.job_view.setModel(self.job_model)
+		jobs_label.setBuddy(self.job_view)
+		layout.addWidget(self.job_view)
+
+		self.log_text = QPlainTextEdit(self)
+		self.log_text.setAccessibleName("Progress Info")
+		self.log_text.setReadOnly(True)
+		# The document drops its oldest lines past this count, so the log works as a ring buffer
+		self.log_text.setMaximumBlockCount(performance_options.get("log_max_lines") or 2000)
+		layout.addWidget(self.log_text)
+		self.setLayout(layout)
+
+
+	def add_job(self, key, title):
+		self.job_model.add_job(key, title)
+
+
+	def update_job(self, key, message):
+		# Progress only changes the job's row, everything else is also kept in the log
+		self.job_model.set_status(key, message)
+		if not is_progress_message(message):
+			self.log(f"[{key}] {message}")
+
+
+	def log(self, message):
+		self.log_text.appendPlainText(message)
+
+
+""" The class end here """
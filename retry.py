@@ -0,0 +1,118 @@
+import random
+import re
+import threading
+import time
+
+from cancellation import JobCancelled
+from metrics import metrics
+
+
+
+# yt-dlp reports most network failures as text inside a DownloadError
+TRANSIENT_ERROR_PATTERN = re.compile(
+	r'HTTP Error (408|429|5\d\d)|timed out|Connection (reset|refused|aborted)|Remote end closed|IncompleteRead|'
+	r'Temporary failure in name resolution|Network is unreachable', re.IGNORECASE)
+
+
+def error_text(error):
+	# Drop yt-dlp's ERROR: prefix and its bug report boilerplate, summaries are read line by line
+	text = str(error).replace('ERROR: ', '')
+	return text.split('; please report this issue')[0].strip()
+
+
+def is_transient_error(error):
+	seen_errors = set()
+	while error is not None and id(error) not in seen_errors:
+		if isinstance(error, JobCancelled):
+			return False
+		if isinstance(error, (ConnectionError, TimeoutError)) or TRANSIENT_ERROR_PATTERN.search(str(error)):
+			return True
+
+		seen_errors.add(id(error))
+		exc_info = getattr(error, 'exc_info', None)
+		error = (exc_info[1] if exc_info else None) or error.__cause__ or error.__context__
+	return False
+
+
+def retry_delay(attempt, base_delay, max_delay):
+	# Full jitter, so URLs that failed together do not all come back at the same moment
+	return random.uniform(0, min(base_delay * 2 ** (attempt - 1), max_delay))
+
+
+def call_with_retries(function, performance_options=None, cancel_token=None, log=print, on_retry=None, stage='download'):
+	performance_options = performance_options or {}
+	attempts = max(performance_options.get("retry_attempts", 3), 1)
+	base_delay = performance_options.get("retry_base_delay", 2)
+	max_delay = performance_options.get("retry_max_delay", 60)
+
+	for attempt in range(1, attempts + 1):
+		try:
+			return function()
+		except Exception as e:
+			if attempt == attempts or not is_transient_error(e):
+				raise
+
+			delay = retry_delay(attempt, base_delay, max_delay)
+			log(f"Retrying in {delay:.1f} seconds ({attempt + 1}/{attempts}) after: {error_text(e)}")
+			metrics.increment('oni_retries_total', stage=stage)
+			metrics.event('retry', stage=stage, attempt=attempt, delay=round(delay, 3), error=error_text(e))
+			if on_retry:
+				on_retry()
+			if cancel_token:
+				if cancel_token.wait(delay):
+					raise JobCancelled("Cancelled")
+			else:
+				time.sleep(delay)
+
+
+
+class ItemOutcomes:
+	SUCCEEDED = 'succeeded'
+	FAILED = 'failed'
+	CANCELLED = 'cancelled'
+
+	def __init__(self):
+		self.outcomes = {}
+		self.retries = {}
+		self.lock = threading.Lock()
+
+
+	def retried(self, item, count=1):
+		with self.lock:
+			self.retries[item] = self.retries.get(item, 0) + count
+
+
+	def record(self, item, status, error=None):
+		with self.lock:
+			self.outcomes[item] = (status, error_text(error) if error is not None else None)
+
+
+	def status(self, item):
+		with self.lock:
+			return self.outcomes.get(item, (None, None))[0]
+
+
+	def count(self, status):
+		with self.lock:
+			return sum(1 for item_status, _ in self.outcomes.values() if item_status == status)
+
+
+	def total_retries(self):
+		with self.lock:
+			return sum(self.retries.values())
+
+
+	def summary(self):
+		with self.lock:
+			outcomes = dict(self.outcomes)
+			retries = {item: count for item, count in self.retries.items() if count}
+
+		counts = {status: sum(1 for item_status, _ in outcomes.values() if item_status == status) for status in (self.SUCCEEDED, self.FAILED, self.CANCELLED)}
+		lines = [f"Summary: {counts[self.SUCCEEDED]} succeeded, {counts[self.FAILED]} failed, {len(retries)} retried"
+			+ (f", {counts[self.CANCELLED]} cancelled" if counts[self.CANCELLED] else "")]
+		lines += [f"  Failed: {item}: {error}" for item, (status, error) in outcomes.items() if status == self.FAILED]
+		lines += [f"  Retried {count} times: {item} ({outcomes.get(item, ('unfinished',))[0]})" for item, count in retries.items()]
+		return "\n".join(lines)
+
+
+""" The class end here """
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+
+class StartupTimer:
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.phases = []
+		self.depth = 0
+		self.lock = threading.Lock()
+
+
+	@contextmanager
+	def phase(self, name):
+		# Phases nest like imports do, so the report has the self and cumulative columns of python -X importtime
+		with self.lock:
+			entry = [name, self.depth, 0.0, 0.0]
+			position = len(self.phases)
+			self.phases.append(entry)
+			self.depth += 1
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			cumulative = time.perf_counter() - started
+			with self.lock:
+				self.depth -= 1
+				entry[3] = cumulative
+				# Everything after this entry was nested inside it, its direct children are one level deeper
+				children = self.phases[position + 1:]
+				entry[2] = cumulative - sum(child[3] for child in children if child[1] == entry[1] + 1)
+
+
+	def record(self, name, seconds):
+		# For work that ran outside a phase block, like the background warm-up
+		with self.lock:
+			self.phases.append([name, 0, seconds, seconds])
+
+
+	def elapsed(self):
+		return time.perf_counter() - self.started
+
+
+	def report(self):
+		lines = ["startup: self [us] | cumulative | phase"]
+		with self.lock:
+			for name, depth, self_seconds, cumulative in self.phases:
+				lines.append(f"startup: {self_seconds * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{name}")
+		lines.append(f"startup: total {self.elapsed() * 1000:.0f} ms since the first import")
+		return "\n".join(lines)
+
+
+""" The class end here """
+
+
+startup_timer = StartupTimer()
+
+
+def startup_report_enabled(performance_options=None):
+	return bool(os.environ.get("ONI_STARTUP_REPORT") or (performance_options or {}).get("startup_report") or '--startup-report' in sys.argv)
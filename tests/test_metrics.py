@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ffmpeg_process
+
+from ffmpeg_process import FfmpegProcess
+from metrics import Metrics
+
+
+def test_render_after_cancelled_and_finished_ffmpeg_runs(monkeypatch):
+	metrics = Metrics()
+	monkeypatch.setattr(ffmpeg_process, 'metrics', metrics)
+
+	cancelled_process = FfmpegProcess(['ffmpeg'])
+	cancelled_process.returncode = 255
+	cancelled_process.record_metrics(1.0, True)
+	finished_process = FfmpegProcess(['ffmpeg'])
+	finished_process.returncode = 0
+	finished_process.record_metrics(1.0, False)
+
+	text = metrics.render()
+	assert 'oni_ffmpeg_exits_total{code="cancelled"} 1' in text
+	assert 'oni_ffmpeg_exits_total{code="0"} 1' in text
+
+
+def test_int_and_str_label_values_share_a_key():
+	metrics = Metrics()
+	metrics.increment('oni_jobs_total', status=1)
+	metrics.increment('oni_jobs_total', status='1')
+	metrics.set_gauge('oni_server_jobs', 2, status='queued')
+	metrics.set_gauge('oni_server_jobs', 3, status=0)
+	metrics.observe('oni_job_seconds', 0.5, code=0)
+	metrics.observe('oni_job_seconds', 0.5, code='cancelled')
+
+	text = metrics.render()
+	assert 'oni_jobs_total{status="1"} 2' in text
+	assert 'oni_server_jobs{status="0"} 3' in text
+	assert 'oni_job_seconds_count{code="cancelled"} 1' in text
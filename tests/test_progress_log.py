@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from progress_log import ProgressThrottle
+
+
+def progress(item, percent):
+	return f"{item}: {percent}% (1.0 fps, 1.00x, ETA: 00:10)"
+
+
+def test_last_progress_line_is_sent_after_the_interval():
+	messages = []
+	progress_log = ProgressThrottle(messages.append, 0.1)
+	for percent in (10, 20, 30):
+		progress_log(progress("Converting a.wav", percent))
+	assert messages == [progress("Converting a.wav", 10)]
+
+	time.sleep(0.3)
+	assert messages == [progress("Converting a.wav", 10), progress("Converting a.wav", 30)]
+
+
+def test_pending_progress_comes_before_other_messages():
+	messages = []
+	progress_log = ProgressThrottle(messages.append, 10)
+	progress_log(progress("Converting a.wav", 10))
+	progress_log(progress("Converting a.wav", 99))
+	progress_log("Conversion finished for a.wav")
+	assert messages == [progress("Converting a.wav", 10), progress("Converting a.wav", 99), "Conversion finished for a.wav"]
+
+
+def test_parallel_items_do_not_hold_back_each_other():
+	messages = []
+	progress_log = ProgressThrottle(messages.append, 10)
+	progress_log(progress("[#1] Downloading", 10))
+	progress_log(progress("[#2] Downloading", 50))
+	progress_log(progress("Converting b.wav", 5))
+	assert messages == [progress("[#1] Downloading", 10), progress("[#2] Downloading", 50), progress("Converting b.wav", 5)]